@@ -0,0 +1,160 @@
+import hashlib
+import threading
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient, ShoppingCart, Tag
+
+SHOPPING_CART_KEY = "shopping_cart:{}:{}"
+CATALOG_REVISION_KEY = "catalog_revision:{}"
+TAG_IDS_KEY = "tag_ids:{}"
+RECIPE_LIST_KEY = "recipe_list:{}"
+
+# Recipes whose ingredients changed in the current transaction.
+changed_recipes = threading.local()
+
+
+def get_catalog_revision(catalog):
+    """
+    Opaque revision of a catalog ("ingredients", "tags"); it changes
+    every time the catalog is modified. Revisions expire after
+    CACHE_REVISION_TIMEOUT, so a change made by a process that does not
+    share the cache (e.g. manage.py loadmodels next to a local memory
+    cache) is picked up within that time.
+    """
+    return cache.get_or_set(
+        CATALOG_REVISION_KEY.format(catalog),
+        lambda: uuid4().hex,
+        settings.CACHE_REVISION_TIMEOUT,
+    )
+
+
+def bump_catalog_revision(catalog):
+    cache.set(
+        CATALOG_REVISION_KEY.format(catalog),
+        uuid4().hex,
+        settings.CACHE_REVISION_TIMEOUT,
+    )
+
+
+def bump_recipe_list():
+    """Drops the cached anonymous recipe pages once the transaction commits."""
+    transaction.on_commit(lambda: bump_catalog_revision("recipe_list"))
+
+
+def bump_popular_recipe_list():
+    """
+    Drops only the cached ?ordering=popular pages once the transaction
+    commits; favorites_count changes the order of no other page.
+    """
+    transaction.on_commit(
+        lambda: bump_catalog_revision("recipe_list:popular")
+    )
+
+
+def get_tag_ids():
+    """Returns the {slug: id} map of all tags."""
+    return cache.get_or_set(
+        TAG_IDS_KEY.format(get_catalog_revision("tags")),
+        lambda: dict(Tag.objects.values_list("slug", "id")),
+        settings.CACHE_REVISION_TIMEOUT,
+    )
+
+
+def get_recipe_list_key(request):
+    """
+    Cache key of an anonymous recipe list page: the normalized query
+    string, the host the links are built for and the revision that
+    changes whenever a recipe, its ingredients or tags are modified.
+    Popular pages also depend on the revision bumped by favorites.
+    """
+    params = sorted(
+        (name, sorted(values)) for name, values in request.query_params.lists()
+    )
+    revisions = [get_catalog_revision("recipe_list")]
+    if request.query_params.get("ordering") == "popular":
+        revisions.append(get_catalog_revision("recipe_list:popular"))
+    return RECIPE_LIST_KEY.format(
+        hashlib.md5(
+            repr(
+                (
+                    request.build_absolute_uri("/"),
+                    params,
+                    revisions,
+                )
+            ).encode()
+        ).hexdigest()
+    )
+
+
+def get_shopping_cart(user_id):
+    """
+    Returns the aggregated shopping list of the user as a dict
+    {ingredient_id: [name, measurement_unit, amount]}.
+    The list is cached under the revision of the user's cart, which is
+    bumped after every committed change of the cart or of the recipes
+    in it, so a list is never edited in place.
+    """
+    key = SHOPPING_CART_KEY.format(
+        user_id, get_catalog_revision(f"shopping_cart:{user_id}")
+    )
+    lines = cache.get(key)
+    if lines is None:
+        lines = {
+            row["ingredient"]: [
+                row["ingredient__name"],
+                row["ingredient__measurement_unit"],
+                row["amount"],
+            ]
+            for row in RecipeIngredient.objects.filter(
+                recipe__shopping_cart__user=user_id
+            )
+            .values(
+                "ingredient",
+                "ingredient__name",
+                "ingredient__measurement_unit",
+            )
+            .annotate(amount=Sum("amount"))
+            .iterator()
+        }
+        cache.set(key, lines, settings.SHOPPING_CART_CACHE_TIMEOUT)
+    return lines
+
+
+def bump_shopping_cart(user_id):
+    """Drops the cached list of the user once the transaction commits."""
+    transaction.on_commit(
+        lambda: bump_catalog_revision(f"shopping_cart:{user_id}")
+    )
+
+
+def bump_recipe_shopping_carts(recipe_id):
+    """
+    Drops the cached lists of everyone who has the recipe in the cart
+    once the transaction commits. Recipes changed within one transaction
+    are collected, so they cost a single query.
+    """
+    recipe_ids = changed_recipes.__dict__.setdefault("ids", set())
+    recipe_ids.add(recipe_id)
+    transaction.on_commit(flush_recipe_shopping_carts)
+
+
+def flush_recipe_shopping_carts():
+    recipe_ids = changed_recipes.__dict__.pop("ids", None)
+    if not recipe_ids:
+        return
+    cache.set_many(
+        {
+            CATALOG_REVISION_KEY.format(f"shopping_cart:{user_id}"): (
+                uuid4().hex
+            )
+            for user_id in ShoppingCart.objects.filter(
+                recipe__in=recipe_ids
+            ).values_list("user_id", flat=True)
+        },
+        settings.CACHE_REVISION_TIMEOUT,
+    )
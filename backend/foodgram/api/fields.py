@@ -0,0 +1,99 @@
+import base64
+import binascii
+import uuid
+
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+
+# Number of base64 characters decoded at a time, a multiple of 4.
+CHUNK_SIZE = 64 * 1024
+
+
+class RecipeImageField(Base64ImageField):
+    """
+    Image sent either as a base64 data URI in JSON or as a file part of
+    a multipart/form-data request.
+    The base64 text is decoded into a temporary file chunk by chunk.
+    The size and the pixel count from the image header are checked before
+    Pillow decodes the whole image.
+    """
+
+    ALLOWED_TYPES = ("jpeg", "png", "gif", "webp")
+    default_error_messages = {
+        "too_large": "Размер изображения не должен превышать {max_size} МБ.",
+        "too_many_pixels": (
+            "Изображение не должно быть больше {max_pixels} мегапикселей."
+        ),
+    }
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        decoded = isinstance(data, str)
+        if decoded:
+            data = self.decode(data)
+        elif not isinstance(data, UploadedFile):
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        self.check_size(data.size)
+        image_format = self.inspect(data)
+        if decoded:
+            data.name = f"{uuid.uuid4()}.{image_format}"
+        return serializers.ImageField.to_internal_value(self, data)
+
+    def check_size(self, size):
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail(
+                "too_large", max_size=settings.RECIPE_IMAGE_MAX_SIZE >> 20
+            )
+
+    def check_pixels(self, pixels):
+        if pixels > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail(
+                "too_many_pixels",
+                max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS // 10**6,
+            )
+
+    def decode(self, data):
+        """Decodes the base64 string into a temporary file."""
+        if ";base64," in data:
+            data = data.split(";base64,", 1)[1]
+        self.check_size(len(data) // 4 * 3)
+        file = TemporaryUploadedFile("image", None, 0, None)
+        rest = ""
+        try:
+            for start in range(0, len(data), CHUNK_SIZE):
+                stop = start + CHUNK_SIZE
+                chunk = rest + "".join(data[start:stop].split())
+                end = len(chunk) // 4 * 4
+                file.write(base64.b64decode(chunk[:end], validate=True))
+                rest = chunk[end:]
+            if rest:
+                raise binascii.Error
+        except (binascii.Error, ValueError):
+            file.close()
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
+    def inspect(self, file):
+        """
+        Reads the image header, checks the pixel count and returns
+        the image format.
+        """
+        try:
+            image = Image.open(file)
+        except Image.DecompressionBombError:
+            self.check_pixels(float("inf"))
+        except (OSError, SyntaxError, ValueError):
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        image_format = (image.format or "").lower()
+        if image_format not in self.ALLOWED_TYPES:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        self.check_pixels(image.width * image.height)
+        file.seek(0)
+        return image_format
@@ -1,30 +1,52 @@
 from django_filters import rest_framework as filter
-from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe, Tag
+from django.db.models import Count, Exists, FloatField, OuterRef, Q
+from django.db.models.functions import Cast
 
+from recipes.models import Recipe, RecipeIngredient, RecipeTag
 
-class IngredientFilter(SearchFilter):
-    search_param = "name"
+from .cache import get_tag_ids
+from .search import search_recipes
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
+
+
+class NumberInFilter(filter.BaseInFilter, filter.NumberFilter):
+    pass
 
 
 class RecipeFilter(filter.FilterSet):
     author = filter.CharFilter()
-    tags = filter.ModelMultipleChoiceFilter(
-        field_name="tags__slug",
-        queryset=Tag.objects.all(),
-        label="Tags",
-        to_field_name="slug",
+    tags = filter.MultipleChoiceFilter(
+        choices=tag_choices, method="get_tags", label="Tags"
     )
     is_favorited = filter.BooleanFilter(method="get_favorite")
     is_in_shopping_cart = filter.BooleanFilter(
         method="get_is_in_shopping_cart"
     )
+    ingredients = NumberInFilter(method="get_ingredients")
+    search = filter.CharFilter(method="get_search")
+    ordering = filter.ChoiceFilter(
+        choices=[("popular", "popular")], method="get_ordering"
+    )
 
     class Meta:
         model = Recipe
         fields = ["tags", "author", "is_favorited", "is_in_shopping_cart"]
 
+    def get_tags(self, queryset, name, value):
+        tag_ids = get_tag_ids()
+        return queryset.filter(
+            Exists(
+                RecipeTag.objects.filter(
+                    recipe=OuterRef("pk"),
+                    tag_id__in=[tag_ids[slug] for slug in value],
+                )
+            )
+        )
+
     def get_favorite(self, queryset, name, value):
         if value:
             return queryset.filter(favorites__user=self.request.user)
@@ -34,3 +56,44 @@ class RecipeFilter(filter.FilterSet):
         if value:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+    def get_ingredients(self, queryset, name, value):
+        """
+        Recipes containing any of the given ingredients, the ones with the
+        largest share of their ingredients among the given first.
+        """
+        if not value:
+            return queryset
+        return (
+            queryset.filter(
+                id__in=RecipeIngredient.objects.filter(
+                    ingredient__in=value
+                ).values("recipe")
+            )
+            .annotate(
+                coverage=Cast(
+                    Count(
+                        "recipe_ingredient_model",
+                        filter=Q(
+                            recipe_ingredient_model__ingredient__in=value
+                        ),
+                    ),
+                    FloatField(),
+                )
+                / Count("recipe_ingredient_model")
+            )
+            .order_by("-coverage", "-pub_date", "-id")
+        )
+
+    def get_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        return search_recipes(queryset, value).order_by(
+            "-search_rank", "-pub_date", "-id"
+        )
+
+    def get_ordering(self, queryset, name, value):
+        if value == "popular":
+            return queryset.order_by("-favorites_count", "-pub_date", "-id")
+        return queryset
@@ -0,0 +1,64 @@
+import bisect
+import threading
+
+from recipes.models import Ingredient
+
+from .cache import get_catalog_revision
+
+
+class IngredientIndex:
+    """
+    Process-local index of ingredient names for autocomplete.
+    Names are kept casefolded in a sorted list, so a prefix lookup is
+    two binary searches. The index is rebuilt when the ingredient catalog
+    revision in the cache changes. The revision expires after
+    CACHE_REVISION_TIMEOUT, so ingredients loaded by another process are
+    indexed within that time even when the cache is not shared.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.revision = None
+        self.entries = ([], [])
+
+    def refresh(self):
+        revision = get_catalog_revision("ingredients")
+        if revision == self.revision:
+            return
+        with self.lock:
+            if revision == self.revision:
+                return
+            ingredients = sorted(
+                Ingredient.objects.all(),
+                key=lambda ingredient: (
+                    ingredient.name.casefold(),
+                    ingredient.id,
+                ),
+            )
+            names = [ingredient.name.casefold() for ingredient in ingredients]
+            self.entries = (names, ingredients)
+            self.revision = revision
+
+    def search(self, query, limit=None):
+        """
+        Ingredients whose name starts with the query, followed by those
+        that only contain it, each group in alphabetical order.
+        """
+        self.refresh()
+        names, ingredients = self.entries
+        query = query.casefold()
+        start = bisect.bisect_left(names, query)
+        end = bisect.bisect_left(names, query + "\U0010ffff", start)
+        result = ingredients[start:end]
+        if query and (limit is None or len(result) < limit):
+            result += [
+                ingredient
+                for position, (name, ingredient) in enumerate(
+                    zip(names, ingredients)
+                )
+                if query in name and not start <= position < end
+            ]
+        return result[:limit]
+
+
+ingredient_index = IngredientIndex()
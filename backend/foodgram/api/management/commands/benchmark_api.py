@@ -0,0 +1,354 @@
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from io import StringIO
+
+from rest_framework.test import APIClient
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment,
+    teardown_test_environment,
+)
+
+from recipes.images import wait_for_variants
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag,
+)
+from users.models import Subscription, User
+
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA"
+    "DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+
+# Maximum number of SQL queries a single request may issue. The "large"
+# scenarios request many more rows than their base scenario with the same
+# budget, so any per-row query (N+1) pushes them over the limit.
+QUERY_BUDGETS = {
+    "recipe_list": 5,
+    "recipe_list_large": 5,
+    "recipe_list_anonymous": 4,
+    "recipe_list_cursor": 4,
+    "recipe_list_tags": 6,
+    "recipe_list_popular": 5,
+    "recipe_list_favorited": 5,
+    "recipe_list_search": 5,
+    "recipe_list_ingredients": 5,
+    "recipe_detail": 5,
+    "recipe_create": 17,
+    "recipe_update": 18,
+    "recipe_update_partial": 8,
+    "recipe_feed": 6,
+    "subscriptions": 4,
+    "subscriptions_large": 4,
+    "download_shopping_cart": 1,
+    "ingredients_search": 1,
+    "tags": 1,
+    "users_list": 2,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database with a realistic dataset and "
+        "checks the query count and latency of every API endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--recipes", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                started = time.perf_counter()
+                self.seed(
+                    options["users"], options["recipes"], options["seed"]
+                )
+                self.stdout.write(
+                    "Seeded {users} users and {recipes} recipes in "
+                    "{elapsed:.1f}s".format(
+                        users=options["users"],
+                        recipes=options["recipes"],
+                        elapsed=time.perf_counter() - started,
+                    )
+                )
+                failures = self.run_scenarios(options["repeat"])
+                wait_for_variants()
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        if failures:
+            raise CommandError(
+                "Query budget exceeded: {}".format(", ".join(failures))
+            )
+
+    def seed(self, users_count, recipes_count, seed):
+        """
+        Generates the dataset and makes sure the benchmark user has enough
+        subscriptions, followers, favorites and cart items for every
+        scenario.
+        """
+        call_command(
+            "generate_fixtures",
+            users=users_count,
+            recipes=recipes_count,
+            seed=seed,
+            stdout=StringIO(),
+        )
+        self.user = User.objects.order_by("id").first()
+        authors = list(
+            Recipe.objects.exclude(author=self.user)
+            .values_list("author_id", flat=True)
+            .distinct()
+        )
+        followers = list(
+            User.objects.exclude(id=self.user.id).values_list("id", flat=True)
+        )
+        recipe_ids = list(Recipe.objects.values_list("id", flat=True))
+        Subscription.objects.bulk_create(
+            (
+                Subscription(user=self.user, author_id=author_id)
+                for author_id in self.random.sample(
+                    authors, min(30, len(authors))
+                )
+            ),
+            ignore_conflicts=True,
+        )
+        # Followers make recipe_create measure the timeline fan-out.
+        Subscription.objects.bulk_create(
+            (
+                Subscription(user_id=user_id, author=self.user)
+                for user_id in self.random.sample(
+                    followers, min(20, len(followers))
+                )
+            ),
+            ignore_conflicts=True,
+        )
+        Favorite.objects.bulk_create(
+            (
+                Favorite(user=self.user, recipe_id=recipe_id)
+                for recipe_id in self.random.sample(recipe_ids, 10)
+            ),
+            ignore_conflicts=True,
+        )
+        ShoppingCart.objects.bulk_create(
+            (
+                ShoppingCart(user=self.user, recipe_id=recipe_id)
+                for recipe_id in self.random.sample(recipe_ids, 10)
+            ),
+            ignore_conflicts=True,
+        )
+        call_command("recount", stdout=StringIO())
+        call_command("rebuild_timelines", stdout=StringIO())
+
+    def recipe_payload(self):
+        ingredient_ids = self.random.sample(
+            list(Ingredient.objects.values_list("id", flat=True)), 20
+        )
+        return {
+            "ingredients": [
+                {"id": ingredient_id, "amount": self.random.randint(1, 500)}
+                for ingredient_id in ingredient_ids
+            ],
+            "tags": list(Tag.objects.values_list("id", flat=True)),
+            "image": IMAGE,
+            "name": "Новый рецепт",
+            "text": "Описание рецепта",
+            "cooking_time": 30,
+        }
+
+    def get_scenarios(self):
+        recipe = Recipe.objects.first()
+        own_recipe = Recipe.objects.create(
+            author=self.user,
+            name="Рецепт для изменения",
+            text="Описание рецепта",
+            cooking_time=10,
+            image="recipes/images/benchmark.png",
+        )
+        # Updates replace the ingredients of a recipe somebody is going to
+        # cook, so the shopping list invalidation is part of the budget.
+        ShoppingCart.objects.create(user=self.user, recipe=own_recipe)
+        tags = "&".join(
+            f"tags={slug}"
+            for slug in Tag.objects.values_list("slug", flat=True)
+        )
+        ingredients = ",".join(
+            str(ingredient_id)
+            for ingredient_id in RecipeIngredient.objects.values_list(
+                "ingredient_id", flat=True
+            )[:5]
+        )
+        return [
+            ("recipe_list", "get", "/api/recipes/?limit=6", None, True),
+            (
+                "recipe_list_large",
+                "get",
+                "/api/recipes/?limit=100",
+                None,
+                True,
+            ),
+            (
+                "recipe_list_anonymous",
+                "get",
+                "/api/recipes/?limit=6",
+                None,
+                False,
+            ),
+            (
+                "recipe_list_cursor",
+                "get",
+                "/api/recipes/?cursor=&limit=6",
+                None,
+                True,
+            ),
+            (
+                "recipe_list_tags",
+                "get",
+                f"/api/recipes/?limit=6&{tags}",
+                None,
+                True,
+            ),
+            (
+                "recipe_list_popular",
+                "get",
+                "/api/recipes/?limit=6&ordering=popular",
+                None,
+                True,
+            ),
+            (
+                "recipe_list_favorited",
+                "get",
+                "/api/recipes/?limit=6&is_favorited=1",
+                None,
+                True,
+            ),
+            (
+                "recipe_list_search",
+                "get",
+                "/api/recipes/?limit=6&search=рецепт 1",
+                None,
+                True,
+            ),
+            (
+                "recipe_list_ingredients",
+                "get",
+                f"/api/recipes/?limit=6&ingredients={ingredients}",
+                None,
+                True,
+            ),
+            ("recipe_detail", "get", f"/api/recipes/{recipe.id}/", None, True),
+            (
+                "recipe_create",
+                "post",
+                "/api/recipes/",
+                self.recipe_payload,
+                True,
+            ),
+            (
+                "recipe_update",
+                "put",
+                f"/api/recipes/{own_recipe.id}/",
+                self.recipe_payload,
+                True,
+            ),
+            (
+                "recipe_update_partial",
+                "patch",
+                f"/api/recipes/{own_recipe.id}/",
+                lambda: {"name": "Новое название"},
+                True,
+            ),
+            (
+                "recipe_feed",
+                "get",
+                "/api/recipes/feed/?limit=6",
+                None,
+                True,
+            ),
+            (
+                "subscriptions",
+                "get",
+                "/api/users/subscriptions/?limit=6&recipes_limit=3",
+                None,
+                True,
+            ),
+            (
+                "subscriptions_large",
+                "get",
+                "/api/users/subscriptions/?limit=30&recipes_limit=3",
+                None,
+                True,
+            ),
+            (
+                "download_shopping_cart",
+                "get",
+                "/api/recipes/download_shopping_cart/",
+                None,
+                True,
+            ),
+            (
+                "ingredients_search",
+                "get",
+                "/api/ingredients/?name=абр",
+                None,
+                True,
+            ),
+            ("tags", "get", "/api/tags/", None, False),
+            ("users_list", "get", "/api/users/?limit=6", None, True),
+        ]
+
+    def run_scenarios(self, repeat):
+        authenticated = APIClient()
+        authenticated.force_authenticate(self.user)
+        anonymous = APIClient()
+        failures = []
+        self.stdout.write(
+            "{:<24} {:>8} {:>8} {:>12} {:>12}".format(
+                "scenario", "queries", "budget", "median, ms", "max, ms"
+            )
+        )
+        for name, method, url, payload, auth in self.get_scenarios():
+            client = authenticated if auth else anonymous
+            queries, timings = 0, []
+            for _ in range(repeat):
+                data = payload() if payload else None
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = getattr(client, method)(
+                        url, data, format="json"
+                    )
+                    if response.streaming:
+                        b"".join(response.streaming_content)
+                    timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f"{name}: {method.upper()} {url} returned "
+                        f"{response.status_code}"
+                    )
+                queries = max(queries, len(context))
+            budget = QUERY_BUDGETS[name]
+            line = "{:<24} {:>8} {:>8} {:>12.1f} {:>12.1f}".format(
+                name, queries, budget, statistics.median(timings), max(timings)
+            )
+            if queries > budget:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        return failures
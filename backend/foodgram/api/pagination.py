@@ -1,5 +1,222 @@
+import hashlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .cache import get_catalog_revision
+from .timeline import get_feed
+
+RECIPE_COUNT_KEY = "recipe_count:{}"
+
+
+class CountPaginator(Paginator):
+    """Paginator that takes the total number of objects from a callable."""
+
+    def __init__(self, object_list, per_page, get_count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.get_count = get_count
+
+    @cached_property
+    def count(self):
+        return self.get_count(self.object_list)
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = "limit"
+
+
+class RecipePagination(CustomPagination):
+    """
+    Recipe feed pagination with an opt-in keyset mode.
+    Passing ?cursor= (empty for the first page) switches to keyset
+    pagination on (pub_date, id): pages are selected with a WHERE on the
+    last seen row instead of OFFSET and no COUNT(*) is run, so the
+    response has no "count". Filters that order the feed differently
+    (popularity, search rank, ingredient coverage) cannot be combined
+    with it.
+    """
+
+    cursor_query_param = "cursor"
+    cursor_page_size = 6
+    cursor_ordering = ("-pub_date", "-id")
+    invalid_cursor_message = "Неверный курсор."
+    cursor_ordering_message = (
+        "Постраничный вывод по курсору доступен только "
+        "для сортировки по дате публикации."
+    )
+    user_filters = {
+        "is_favorited": "favorites",
+        "is_in_shopping_cart": "shopping_cart",
+    }
+
+    def django_paginator_class(self, queryset, page_size):
+        return CountPaginator(queryset, page_size, self.get_count)
+
+    def get_count(self, queryset):
+        """
+        Total number of recipes matching the request filters.
+        Counts are cached per normalized filter set for a short time and
+        dropped when a recipe is created or deleted, or when the user
+        changes favorites/cart for the filters that depend on them.
+        The unfiltered feed on PostgreSQL uses the planner estimate once
+        the table is large enough for the estimate to be meaningful.
+        """
+        filters = sorted(
+            (name, sorted(values))
+            for name, values in self.request.query_params.lists()
+            if name not in (self.page_query_param, self.page_size_query_param)
+        )
+        if not filters and connection.vendor == "postgresql":
+            estimate = self.get_estimated_count(queryset)
+            if estimate >= settings.RECIPE_COUNT_ESTIMATE_THRESHOLD:
+                return estimate
+        revisions = [get_catalog_revision("recipes")]
+        for name, catalog in self.user_filters.items():
+            if name in self.request.query_params:
+                revisions.append(
+                    get_catalog_revision(f"{catalog}:{self.request.user.id}")
+                )
+        key = RECIPE_COUNT_KEY.format(
+            hashlib.md5(repr((filters, revisions)).encode()).hexdigest()
+        )
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, settings.RECIPE_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_estimated_count(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        if queryset.query.order_by not in ((), self.cursor_ordering):
+            raise ValidationError(
+                {self.cursor_query_param: [self.cursor_ordering_message]}
+            )
+        page_size = self.get_page_size(request) or self.cursor_page_size
+        cursor = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+        reverse = False
+        if cursor is not None:
+            reverse, pub_date, id = cursor
+            if reverse:
+                queryset = queryset.filter(
+                    Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=id)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=id)
+                )
+        ordering = ("pub_date", "id") if reverse else ("-pub_date", "-id")
+        page = list(queryset.order_by(*ordering)[: page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+        has_next = cursor is not None if reverse else has_more
+        has_previous = has_more if reverse else cursor is not None
+        self.next_cursor = (
+            self.encode_cursor(False, page[-1]) if page and has_next else None
+        )
+        self.previous_cursor = (
+            self.encode_cursor(True, page[0])
+            if page and has_previous
+            else None
+        )
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_cursor_link(self.next_cursor)),
+                    ("previous", self.get_cursor_link(self.previous_cursor)),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def encode_cursor(self, reverse, obj):
+        position = "{}|{}|{}".format(
+            int(reverse), obj.pub_date.isoformat(), obj.id
+        )
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            reverse, pub_date, id = (
+                urlsafe_b64decode(cursor.encode()).decode().split("|")
+            )
+            pub_date = parse_datetime(pub_date)
+            if pub_date is None:
+                raise ValueError
+            return reverse == "1", pub_date, int(id)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class FeedPagination(RecipePagination):
+    """
+    Keyset pagination of the subscription feed, forward only.
+    The page is picked from the timeline by get_feed and only then are
+    the recipes loaded.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor_mode = True
+        page_size = self.get_page_size(request) or self.cursor_page_size
+        cursor = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param)
+        )
+        before = None
+        if cursor is not None:
+            reverse, pub_date, id = cursor
+            if reverse:
+                raise NotFound(self.invalid_cursor_message)
+            before = (pub_date, id)
+        rows = get_feed(request.user, page_size + 1, before)
+        ids = [recipe_id for _, recipe_id in rows[:page_size]]
+        recipes = queryset.in_bulk(ids)
+        page = [recipes[id] for id in ids if id in recipes]
+        self.next_cursor = (
+            self.encode_cursor(False, page[-1])
+            if page and len(rows) > page_size
+            else None
+        )
+        self.previous_cursor = None
+        return page
@@ -0,0 +1,42 @@
+import csv
+
+from rest_framework.renderers import BaseRenderer
+
+
+class Echo:
+    """File-like object that hands back whatever is written to it."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartTextRenderer(BaseRenderer):
+    """Shopping list as plain text, one ingredient per line."""
+
+    media_type = "text/plain"
+    format = "txt"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and "detail" in data:
+            data = data["detail"]
+        return str(data).encode(self.charset)
+
+    def stream(self, ingredients):
+        for name, measurement_unit, amount in ingredients:
+            yield f"{name}({measurement_unit}) - {amount}\n"
+
+
+class ShoppingCartCSVRenderer(ShoppingCartTextRenderer):
+    """Shopping list as CSV with a header row."""
+
+    media_type = "text/csv"
+    format = "csv"
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ["Ингредиент", "Единица измерения", "Количество"]
+        )
+        for ingredient in ingredients:
+            yield writer.writerow(ingredient)
@@ -0,0 +1,120 @@
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Value
+from django.db.models.expressions import RawSQL
+
+TS_QUERY = "websearch_to_tsquery('pg_catalog.russian', %s)"
+
+SQLITE_TRIGGERS = {
+    "recipes_recipe_fts_insert": """
+        CREATE TRIGGER recipes_recipe_fts_insert
+        AFTER INSERT ON recipes_recipe
+        BEGIN
+            INSERT INTO recipes_recipe_fts (rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+    """,
+    "recipes_recipe_fts_delete": """
+        CREATE TRIGGER recipes_recipe_fts_delete
+        AFTER DELETE ON recipes_recipe
+        BEGIN
+            INSERT INTO recipes_recipe_fts
+                (recipes_recipe_fts, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+        END
+    """,
+    "recipes_recipe_fts_update": """
+        CREATE TRIGGER recipes_recipe_fts_update
+        AFTER UPDATE OF name, text ON recipes_recipe
+        BEGIN
+            INSERT INTO recipes_recipe_fts
+                (recipes_recipe_fts, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+            INSERT INTO recipes_recipe_fts (rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+    """,
+}
+
+
+def fts_query(value):
+    """
+    FTS5 query matching every word of the value as a prefix; the words
+    are quoted so that FTS5 operators in user input are taken literally.
+    """
+    return " ".join(
+        '"{}"*'.format(word.replace('"', '""')) for word in value.split()
+    )
+
+
+def search_recipes(queryset, value):
+    """
+    Recipes whose name or text match the search query, annotated with
+    search_rank (higher is better).
+    PostgreSQL uses the search_vector column kept up to date by a trigger
+    and its GIN index, SQLite the recipes_recipe_fts FTS5 table. Neither
+    is known to the ORM, see migration 0012_recipe_search.
+    """
+    if connection.vendor == "postgresql":
+        return queryset.filter(
+            RawSQL(
+                f'"recipes_recipe"."search_vector" @@ {TS_QUERY}',
+                [value],
+                output_field=BooleanField(),
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f'ts_rank("recipes_recipe"."search_vector", {TS_QUERY})',
+                [value],
+                output_field=FloatField(),
+            )
+        )
+    if connection.vendor == "sqlite":
+        value = fts_query(value)
+        return queryset.filter(
+            id__in=RawSQL(
+                "SELECT rowid FROM recipes_recipe_fts "
+                "WHERE recipes_recipe_fts MATCH %s",
+                [value],
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                "SELECT -bm25(recipes_recipe_fts) FROM recipes_recipe_fts "
+                "WHERE recipes_recipe_fts MATCH %s "
+                'AND rowid = "recipes_recipe"."id"',
+                [value],
+                output_field=FloatField(),
+            )
+        )
+    return queryset.filter(name__icontains=value).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    )
+
+
+def restore_sqlite_triggers(connection):
+    """
+    SQLite migrations rebuild recipes_recipe from scratch on most schema
+    changes, dropping the triggers that keep the FTS table in sync.
+    Recreates the missing ones and reindexes the table.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+            ["recipes_recipe_fts", *SQLITE_TRIGGERS],
+        )
+        existing = {name for name, in cursor.fetchall()}
+        if "recipes_recipe_fts" not in existing:
+            return
+        missing = [
+            sql
+            for name, sql in SQLITE_TRIGGERS.items()
+            if name not in existing
+        ]
+        for sql in missing:
+            cursor.execute(sql)
+        if missing:
+            cursor.execute(
+                "INSERT INTO recipes_recipe_fts (recipes_recipe_fts) "
+                "VALUES ('rebuild')"
+            )
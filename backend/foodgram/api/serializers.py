@@ -1,10 +1,15 @@
+import json
+
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.utils import html
 from rest_framework.validators import UniqueTogetherValidator
 
-from django.shortcuts import get_object_or_404
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 
+from recipes.images import FORMATS, schedule_variants, variant_names
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -16,6 +21,9 @@ from recipes.models import (
 )
 from users.models import Subscription, User
 
+from .cache import bump_recipe_shopping_carts
+from .fields import RecipeImageField
+
 
 class CustomUserCreateSerializer(UserCreateSerializer):
     """User Creation Serializer."""
@@ -45,9 +53,13 @@ class CustomUserSerializer(UserSerializer):
         request = self.context.get("request")
         if request is None or request.user.is_anonymous:
             return False
-        return Subscription.objects.filter(
-            user=request.user, author=obj
-        ).exists()
+        if "subscribed_author_ids" not in self.context:
+            self.context["subscribed_author_ids"] = set(
+                Subscription.objects.filter(user=request.user).values_list(
+                    "author_id", flat=True
+                )
+            )
+        return obj.id in self.context["subscribed_author_ids"]
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -85,13 +97,17 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     tags = TagSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
-    ingredients = serializers.SerializerMethodField()
+    ingredients = RecipeIngredientSerializer(
+        source="recipe_ingredient_model", many=True, read_only=True
+    )
     is_favorited = serializers.SerializerMethodField(
         method_name="get_is_favorited"
     )
     is_in_shopping_cart = serializers.SerializerMethodField(
         method_name="get_is_in_shopping_cart"
     )
+    image_variants = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -104,15 +120,54 @@ class RecipeSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
+            "image_srcset",
             "text",
             "cooking_time",
         ]
 
-    def get_ingredients(self, obj):
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
-        return RecipeIngredientSerializer(ingredients, many=True).data
+    def get_image_variants(self, obj):
+        """
+        URLs of the resized copies of the image, {variant: {format: url}},
+        or None while they are still being rendered or if the image could
+        not be read. Copies larger than the original are not made, so
+        small images have fewer variants.
+        """
+        if not obj.image_variants_ready or not obj.image_variant_widths:
+            return None
+        request = self.context.get("request")
+        variants = {
+            variant: formats
+            for variant, formats in variant_names(obj.image.name).items()
+            if variant in obj.image_variant_widths
+        }
+        for formats in variants.values():
+            for image_format, name in formats.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                formats[image_format] = url
+        return variants
+
+    def get_image_srcset(self, obj):
+        """{format: srcset} with the real width of every copy."""
+        variants = self.get_image_variants(obj)
+        if variants is None:
+            return None
+        return {
+            image_format: ", ".join(
+                "{} {}w".format(
+                    formats[image_format], obj.image_variant_widths[variant]
+                )
+                for variant, formats in variants.items()
+            )
+            for image_format in FORMATS
+        }
 
     def get_is_favorited(self, obj):
+        annotated = getattr(obj, "is_favorited", None)
+        if annotated is not None:
+            return annotated
         request = self.context.get("request")
         if request is None or request.user.is_anonymous:
             return False
@@ -121,6 +176,9 @@ class RecipeSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        annotated = getattr(obj, "is_in_shopping_cart", None)
+        if annotated is not None:
+            return annotated
         request = self.context.get("request")
         if request is None or request.user.is_anonymous:
             return False
@@ -148,7 +206,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True
     )
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
@@ -163,8 +221,37 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             "cooking_time",
         ]
 
+    def to_internal_value(self, data):
+        if html.is_html_input(data):
+            data = self.parse_multipart(data)
+        return super().to_internal_value(data)
+
+    def parse_multipart(self, data):
+        """
+        In multipart/form-data requests ingredients are sent as a JSON
+        string, tags as a JSON string or as repeated fields.
+        """
+        parsed = {key: data[key] for key in data}
+        tags = data.getlist("tags")
+        if len(tags) > 1:
+            parsed["tags"] = tags
+        for key in ("ingredients", "tags"):
+            if not isinstance(parsed.get(key), str):
+                continue
+            try:
+                parsed[key] = json.loads(parsed[key])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {key: "Некорректный JSON."}
+                )
+        if "tags" in parsed and not isinstance(parsed["tags"], list):
+            parsed["tags"] = [parsed["tags"]]
+        return parsed
+
     def validate(self, data):
-        ingredients = self.initial_data.get("ingredients")
+        ingredients = data.get("ingredients")
+        if ingredients is None:
+            return data
         list = []
         for ingredient in ingredients:
             amount = ingredient["amount"]
@@ -177,21 +264,34 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                     {"ingredient": "Ингредиенты должны быть уникальными!"}
                 )
             list.append(ingredient["id"])
+        existing = Ingredient.objects.in_bulk(list)
+        missing = [id for id in list if id not in existing]
+        if missing:
+            raise serializers.ValidationError(
+                {
+                    "ingredients": "Ингредиенты не найдены: {}".format(
+                        ", ".join(map(str, missing))
+                    )
+                }
+            )
         return data
 
     def create_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            ingredient_one = get_object_or_404(Ingredient, id=ingredient["id"])
-            RecipeIngredient.objects.create(
-                ingredient=ingredient_one,
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                ingredient_id=ingredient["id"],
                 recipe=recipe,
                 amount=ingredient["amount"],
             )
+            for ingredient in ingredients
+        )
 
     def create_tags(self, tags, recipe):
-        for tag in tags:
-            RecipeTag.objects.create(recipe=recipe, tag=tag)
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag) for tag in tags
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
         """
         Creating recipes.
@@ -203,22 +303,99 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=author, **validated_data)
         self.create_ingredients(ingredients, recipe)
         self.create_tags(tags, recipe)
+        transaction.on_commit(lambda: schedule_variants(recipe.id))
         return recipe
 
+    def update_ingredients(self, ingredients, recipe):
+        """
+        Brings the recipe ingredients in line with the request, touching
+        only the rows that were added, removed or had their amount changed.
+        """
+        existing = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipe_ingredient_model.all()
+        }
+        amounts = {
+            ingredient["id"]: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        removed = [
+            recipe_ingredient.id
+            for ingredient_id, recipe_ingredient in existing.items()
+            if ingredient_id not in amounts
+        ]
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            recipe_ingredient = existing.get(ingredient_id)
+            if recipe_ingredient and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        RecipeIngredient.objects.bulk_update(changed, ["amount"])
+        added = [
+            ingredient
+            for ingredient in ingredients
+            if ingredient["id"] not in existing
+        ]
+        self.create_ingredients(added, recipe)
+        if removed or changed or added:
+            bump_recipe_shopping_carts(recipe.id)
+
+    def update_tags(self, tags, recipe):
+        existing = {tag.id for tag in recipe.tags.all()}
+        requested = {tag.id for tag in tags}
+        removed = existing - requested
+        if removed:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=removed
+            ).delete()
+        self.create_tags(
+            [tag for tag in tags if tag.id not in existing], recipe
+        )
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         """
         Changing the recipe.
         Available only to authors.
         """
-        tags = validated_data.pop("tags")
-        ingredients = validated_data.pop("ingredients")
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients(recipe=instance, ingredients=ingredients)
-        return super().update(instance, validated_data)
+        tags = validated_data.pop("tags", None)
+        ingredients = validated_data.pop("ingredients", None)
+        if tags is not None:
+            self.update_tags(tags, instance)
+        if ingredients is not None:
+            self.update_ingredients(ingredients, instance)
+        image_name = instance.image.name
+        instance = super().update(instance, validated_data)
+        if instance.image.name != image_name:
+            Recipe.objects.filter(id=instance.id).update(
+                image_variants_ready=False
+            )
+            instance.image_variants_ready = False
+            transaction.on_commit(lambda: schedule_variants(instance.id))
+        return instance
+
+    def save(self, **kwargs):
+        """
+        Closes the uploaded image once it is stored: temporary files
+        moved into the media storage are not there to delete anymore.
+        """
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get("image")
+            if image is not None:
+                image.close()
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            Prefetch(
+                "recipe_ingredient_model",
+                queryset=RecipeIngredient.objects.select_related("ingredient"),
+            ),
+        )
         return RecipeSerializer(
             instance, context={"request": self.context.get("request")}
         ).data
@@ -280,6 +457,9 @@ class ShowSubscriptionsSerializer(serializers.ModelSerializer):
         ]
 
     def get_is_subscribed(self, obj):
+        annotated = getattr(obj, "is_subscribed", None)
+        if annotated is not None:
+            return annotated
         request = self.context.get("request")
         if request is None or request.user.is_anonymous:
             return False
@@ -291,10 +471,13 @@ class ShowSubscriptionsSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
-        recipes = Recipe.objects.filter(author=obj)
-        limit = request.query_params.get("recipes_limit")
-        if limit:
-            recipes = recipes[: int(limit)]
+        if "recipes_preview" in self.context:
+            recipes = self.context["recipes_preview"].get(obj.id, [])
+        else:
+            recipes = Recipe.objects.filter(author=obj)
+            limit = request.query_params.get("recipes_limit")
+            if limit:
+                recipes = recipes[: int(limit)]
         return ShowFavoriteSerializer(
             recipes, many=True, context={"request": request}
         ).data
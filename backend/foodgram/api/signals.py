@@ -0,0 +1,89 @@
+from django.apps import apps
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag, ShoppingCart,
+    Tag,
+)
+from recipes.signals import variants_ready
+from users.models import Subscription
+
+from . import timeline
+from .cache import (
+    bump_catalog_revision, bump_popular_recipe_list, bump_recipe_list,
+    bump_recipe_shopping_carts, bump_shopping_cart,
+)
+from .search import restore_sqlite_triggers
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredients_changed(**kwargs):
+    bump_catalog_revision("ingredients")
+    bump_recipe_list()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tags_changed(**kwargs):
+    bump_catalog_revision("tags")
+    bump_recipe_list()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(created, **kwargs):
+    if created:
+        bump_catalog_revision("recipes")
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(**kwargs):
+    bump_catalog_revision("recipes")
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+@receiver([post_save, post_delete], sender=RecipeTag)
+@receiver(variants_ready, sender=Recipe)
+def recipe_list_changed(**kwargs):
+    bump_recipe_list()
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+def favorites_changed(instance, **kwargs):
+    bump_catalog_revision(f"favorites:{instance.user_id}")
+    # favorites_count orders ?ordering=popular.
+    bump_popular_recipe_list()
+
+
+@receiver([post_save, post_delete], sender=ShoppingCart)
+def shopping_cart_changed(instance, **kwargs):
+    bump_shopping_cart(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def recipe_ingredient_changed(instance, **kwargs):
+    bump_recipe_shopping_carts(instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: timeline.fan_out(instance))
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_added(instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_removed(instance, **kwargs):
+    # Runs after the users app receiver has decremented followers_count.
+    timeline.remove(instance.user_id, instance.author_id)
+
+
+@receiver(post_migrate, sender=apps.get_app_config("recipes"))
+def recipes_migrated(using, **kwargs):
+    restore_sqlite_triggers(connections[using])
@@ -0,0 +1,803 @@
+import base64
+import csv
+import json
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from recipes.images import generate_variants, wait_for_variants
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag, ShoppingCart,
+    Tag, TimelineEntry,
+)
+from users.models import Subscription, User
+
+from .management.commands.benchmark_api import IMAGE, QUERY_BUDGETS
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+RECIPE_NAMES = [
+    "Борщ",
+    "Салат оливье",
+    "Блины",
+    "Суп грибной",
+    "Омлет",
+    "Плов",
+    "Каша гречневая",
+]
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+class QueryBudgetContext(CaptureQueriesContext):
+    """
+    Fails the test when the block runs more queries than the budget.
+    assertNumQueries checks an exact number, while the budgets of
+    benchmark_api are ceilings shared with a much larger dataset.
+    """
+
+    def __init__(self, test_case, budget):
+        super().__init__(connection)
+        self.test_case = test_case
+        self.budget = budget
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        self.test_case.assertLessEqual(
+            len(self),
+            self.budget,
+            "\n".join(query["sql"] for query in self.captured_queries),
+        )
+
+
+def make_png(width, height, noise=False):
+    if noise:
+        image = Image.effect_noise((width, height), 64).convert("RGB")
+    else:
+        image = Image.new("RGB", (width, height), "#E26C2D")
+    buffer = BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def create_user(name):
+    return User.objects.create_user(
+        username=name,
+        email=f"{name}@foodgram.test",
+        password="password",
+        first_name=name.title(),
+        last_name="Тестов",
+    )
+
+
+def create_recipe(author, name, ingredients, tags):
+    """ingredients is a list of (ingredient, amount) pairs."""
+    recipe = Recipe.objects.create(
+        author=author,
+        name=name,
+        text="Описание рецепта",
+        cooking_time=20,
+        image="recipes/images/test.png",
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in ingredients
+    )
+    RecipeTag.objects.bulk_create(
+        RecipeTag(recipe=recipe, tag=tag) for tag in tags
+    )
+    return recipe
+
+
+def create_catalog():
+    tags = [
+        Tag.objects.create(name=name, color=color, slug=slug)
+        for name, color, slug in [
+            ("Завтрак", "#E26C2D", "breakfast"),
+            ("Обед", "#49B64E", "lunch"),
+            ("Ужин", "#8775D2", "dinner"),
+        ]
+    ]
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f"ингредиент {number:02}", measurement_unit="г")
+        for number in range(30)
+    )
+    return tags, list(Ingredient.objects.order_by("name"))
+
+
+class QueryBudgetMixin:
+    def assertQueryBudget(self, scenario):
+        return QueryBudgetContext(self, QUERY_BUDGETS[scenario])
+
+    def setUp(self):
+        super().setUp()
+        # Cached pages and revisions outlive the rolled back data.
+        cache.clear()
+
+    def recipe_ids(self, response):
+        return [recipe["id"] for recipe in response.data["results"]]
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeReadTests(QueryBudgetMixin, APITestCase):
+    """
+    Read endpoints on a small catalog: response bodies and the query
+    budgets of benchmark_api.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags, cls.ingredients = create_catalog()
+        cls.alice = create_user("alice")
+        cls.bob = create_user("bob")
+        cls.carol = create_user("carol")
+        # Recipe k has 10 + k ingredients starting with ingredient k,
+        # so ingredient k is the first one only in recipes up to k.
+        cls.recipes = []
+        for number, name in enumerate(RECIPE_NAMES):
+            last = 2 * number + 10
+            cls.recipes.append(
+                create_recipe(
+                    cls.alice if number < 4 else cls.bob,
+                    name,
+                    [
+                        (ingredient, number + 1)
+                        for ingredient in cls.ingredients[number:last]
+                    ],
+                    [cls.tags[number % 3]],
+                )
+            )
+        cls.newest_first = [recipe.id for recipe in reversed(cls.recipes)]
+        Subscription.objects.create(user=cls.carol, author=cls.alice)
+        Favorite.objects.create(user=cls.carol, recipe=cls.recipes[0])
+        Favorite.objects.create(user=cls.carol, recipe=cls.recipes[2])
+        Favorite.objects.create(user=cls.bob, recipe=cls.recipes[2])
+        ShoppingCart.objects.create(user=cls.carol, recipe=cls.recipes[0])
+        ShoppingCart.objects.create(user=cls.carol, recipe=cls.recipes[1])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.carol)
+
+    def test_list_annotates_user_flags(self):
+        with self.assertQueryBudget("recipe_list"):
+            response = self.client.get("/api/recipes/?limit=6")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], len(self.recipes))
+        self.assertEqual(self.recipe_ids(response), self.newest_first[:6])
+        flags = {
+            recipe["id"]: (
+                recipe["is_favorited"],
+                recipe["is_in_shopping_cart"],
+            )
+            for recipe in response.data["results"]
+        }
+        self.assertEqual(flags[self.recipes[1].id], (False, True))
+        self.assertEqual(flags[self.recipes[2].id], (True, False))
+        self.assertEqual(flags[self.recipes[3].id], (False, False))
+        first = response.data["results"][-1]
+        self.assertEqual(first["author"]["username"], "alice")
+        self.assertTrue(first["author"]["is_subscribed"])
+        self.assertEqual(len(first["ingredients"]), 11)
+        self.assertEqual(first["tags"][0]["slug"], "lunch")
+
+    def test_list_pagination(self):
+        response = self.client.get("/api/recipes/?limit=6")
+        self.assertIsNone(response.data["previous"])
+        self.assertIn("page=2", response.data["next"])
+        response = self.client.get(response.data["next"])
+        self.assertEqual(self.recipe_ids(response), self.newest_first[6:])
+        self.assertIsNone(response.data["next"])
+        self.assertIsNotNone(response.data["previous"])
+
+    def test_anonymous_list_is_cached(self):
+        self.client.force_authenticate(None)
+        with self.assertQueryBudget("recipe_list_anonymous"):
+            response = self.client.get("/api/recipes/?limit=6&page=1")
+        self.assertFalse(
+            any(
+                recipe["is_favorited"] or recipe["is_in_shopping_cart"]
+                for recipe in response.data["results"]
+            )
+        )
+        with self.assertNumQueries(0):
+            cached = self.client.get("/api/recipes/?page=1&limit=6")
+        self.assertEqual(cached.data, response.data)
+
+    def test_cursor_pagination(self):
+        ids = []
+        url = "/api/recipes/?cursor=&limit=3"
+        while url:
+            with self.assertQueryBudget("recipe_list_cursor"):
+                response = self.client.get(url)
+            self.assertNotIn("count", response.data)
+            ids += self.recipe_ids(response)
+            url = response.data["next"]
+        self.assertEqual(ids, self.newest_first)
+
+    def test_cursor_rejects_other_orderings(self):
+        response = self.client.get("/api/recipes/?cursor=&ordering=popular")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_by_tags(self):
+        with self.assertQueryBudget("recipe_list_tags"):
+            response = self.client.get(
+                "/api/recipes/?limit=10&tags=breakfast&tags=dinner"
+            )
+        self.assertEqual(
+            self.recipe_ids(response),
+            [
+                recipe.id
+                for recipe in reversed(self.recipes)
+                if recipe.tags.get().slug in ("breakfast", "dinner")
+            ],
+        )
+
+    def test_filter_by_author(self):
+        response = self.client.get(
+            f"/api/recipes/?limit=10&author={self.bob.id}"
+        )
+        self.assertEqual(self.recipe_ids(response), self.newest_first[:3])
+
+    def test_filter_by_user_lists(self):
+        with self.assertQueryBudget("recipe_list_favorited"):
+            response = self.client.get("/api/recipes/?limit=10&is_favorited=1")
+        self.assertEqual(
+            self.recipe_ids(response),
+            [self.recipes[2].id, self.recipes[0].id],
+        )
+        self.assertEqual(response.data["count"], 2)
+        response = self.client.get(
+            "/api/recipes/?limit=10&is_in_shopping_cart=1"
+        )
+        self.assertEqual(
+            self.recipe_ids(response),
+            [self.recipes[1].id, self.recipes[0].id],
+        )
+
+    def test_ordering_popular(self):
+        with self.assertQueryBudget("recipe_list_popular"):
+            response = self.client.get(
+                "/api/recipes/?limit=3&ordering=popular"
+            )
+        self.assertEqual(
+            self.recipe_ids(response),
+            [self.recipes[2].id, self.recipes[0].id, self.newest_first[0]],
+        )
+
+    def test_search(self):
+        with self.assertQueryBudget("recipe_list_search"):
+            response = self.client.get("/api/recipes/?limit=6&search=суп")
+        self.assertEqual(self.recipe_ids(response), [self.recipes[3].id])
+
+    def test_filter_by_ingredients_ranks_by_coverage(self):
+        first, second = self.ingredients[0], self.ingredients[1]
+        with self.assertQueryBudget("recipe_list_ingredients"):
+            response = self.client.get(
+                f"/api/recipes/?limit=6&ingredients={first.id},{second.id}"
+            )
+        self.assertEqual(
+            self.recipe_ids(response),
+            [self.recipes[0].id, self.recipes[1].id],
+        )
+
+    def test_detail(self):
+        recipe = self.recipes[0]
+        with self.assertQueryBudget("recipe_detail"):
+            response = self.client.get(f"/api/recipes/{recipe.id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["is_favorited"])
+        self.assertTrue(response.data["is_in_shopping_cart"])
+        self.assertEqual(
+            [
+                (ingredient["id"], ingredient["amount"])
+                for ingredient in response.data["ingredients"]
+            ],
+            [(ingredient.id, 1) for ingredient in self.ingredients[:10]],
+        )
+        response = self.client.get(
+            f"/api/recipes/{recipe.id}/", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_feed(self):
+        with self.assertQueryBudget("recipe_feed"):
+            response = self.client.get("/api/recipes/feed/?limit=3")
+        alice_recipes = [recipe.id for recipe in reversed(self.recipes[:4])]
+        self.assertEqual(self.recipe_ids(response), alice_recipes[:3])
+        response = self.client.get(response.data["next"])
+        self.assertEqual(self.recipe_ids(response), alice_recipes[3:])
+        self.assertIsNone(response.data["next"])
+
+    def test_download_shopping_cart(self):
+        expected = {
+            (row["ingredient__name"], row["amount"])
+            for row in RecipeIngredient.objects.filter(
+                recipe__in=self.recipes[:2]
+            )
+            .values("ingredient__name")
+            .annotate(amount=Sum("amount"))
+        }
+        with self.assertQueryBudget("download_shopping_cart"):
+            response = self.client.get(
+                "/api/recipes/download_shopping_cart/?format=csv"
+            )
+            content = b"".join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = list(csv.reader(content.splitlines()))
+        self.assertEqual(
+            rows[0], ["Ингредиент", "Единица измерения", "Количество"]
+        )
+        self.assertEqual(
+            {(name, int(amount)) for name, unit, amount in rows[1:]},
+            expected,
+        )
+        self.assertIn(("ингредиент 01", 3), expected)
+
+    def test_subscriptions(self):
+        with self.assertQueryBudget("subscriptions"):
+            response = self.client.get(
+                "/api/users/subscriptions/?limit=6&recipes_limit=2"
+            )
+        (author,) = response.data["results"]
+        self.assertEqual(author["id"], self.alice.id)
+        self.assertEqual(author["recipes_count"], 4)
+        self.assertEqual(
+            [recipe["id"] for recipe in author["recipes"]],
+            [self.recipes[3].id, self.recipes[2].id],
+        )
+
+    def test_subscriptions_empty(self):
+        self.client.force_authenticate(self.bob)
+        response = self.client.get(
+            "/api/users/subscriptions/?limit=6&recipes_limit=3"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 0)
+        self.assertEqual(response.data["results"], [])
+
+    def test_ingredients_search(self):
+        Ingredient.objects.create(
+            name="сок абрикосовый", measurement_unit="мл"
+        )
+        Ingredient.objects.create(name="абрикос", measurement_unit="г")
+        with self.assertQueryBudget("ingredients_search"):
+            response = self.client.get("/api/ingredients/?name=абр")
+        self.assertEqual(
+            [ingredient["name"] for ingredient in response.data],
+            ["абрикос", "сок абрикосовый"],
+        )
+
+    def test_tags(self):
+        self.client.force_authenticate(None)
+        with self.assertQueryBudget("tags"):
+            response = self.client.get("/api/tags/")
+        self.assertEqual(
+            [tag["slug"] for tag in response.data],
+            ["breakfast", "lunch", "dinner"],
+        )
+
+    def test_users_list(self):
+        with self.assertQueryBudget("users_list"):
+            response = self.client.get("/api/users/?limit=6")
+        subscribed = {
+            user["username"]: user["is_subscribed"] for user in response.data
+        }
+        self.assertEqual(
+            subscribed, {"alice": True, "bob": False, "carol": False}
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeWriteTests(QueryBudgetMixin, APITransactionTestCase):
+    """
+    Write endpoints with real transactions, so on_commit callbacks run
+    and the query counts match a production request.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("api.serializers.schedule_variants")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tags, self.ingredients = create_catalog()
+        self.alice = create_user("alice")
+        self.carol = create_user("carol")
+        self.recipe = create_recipe(
+            self.alice,
+            "Борщ",
+            [(ingredient, 100) for ingredient in self.ingredients[:12]],
+            self.tags[:1],
+        )
+        # Subscribing backfills the feed with the recipes created so far.
+        Subscription.objects.create(user=self.carol, author=self.alice)
+        self.client.force_authenticate(self.alice)
+        self.reader = APIClient()
+        self.reader.force_authenticate(self.carol)
+
+    def payload(self, ingredients, amount):
+        return {
+            "ingredients": [
+                {"id": ingredient.id, "amount": amount}
+                for ingredient in ingredients
+            ],
+            "tags": [tag.id for tag in self.tags[:2]],
+            "image": IMAGE,
+            "name": "Новый рецепт",
+            "text": "Описание рецепта",
+            "cooking_time": 30,
+        }
+
+    def download(self):
+        response = self.reader.get("/api/recipes/download_shopping_cart/")
+        return b"".join(response.streaming_content).decode().splitlines()
+
+    def test_create_recipe(self):
+        with self.assertQueryBudget("recipe_create"):
+            response = self.client.post(
+                "/api/recipes/",
+                self.payload(self.ingredients[5:20], 7),
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["ingredients"]), 15)
+        self.assertEqual(
+            [tag["slug"] for tag in response.data["tags"]],
+            ["breakfast", "lunch"],
+        )
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.recipes_count, 2)
+        response = self.reader.get("/api/recipes/feed/?limit=6")
+        self.assertEqual(response.data["results"][0]["name"], "Новый рецепт")
+
+    def test_recipe_saved_outside_api_reaches_feed(self):
+        # The admin saves recipes with Model.save(), not the serializer.
+        recipe = Recipe(
+            author=self.alice,
+            name="Блины",
+            text="Описание рецепта",
+            cooking_time=20,
+            image="recipes/images/test.png",
+        )
+        recipe.save()
+        response = self.reader.get("/api/recipes/feed/?limit=6")
+        self.assertEqual(
+            self.recipe_ids(response), [recipe.id, self.recipe.id]
+        )
+
+    def test_update_recipe_refreshes_shopping_lists(self):
+        ShoppingCart.objects.create(user=self.carol, recipe=self.recipe)
+        self.assertIn("ингредиент 00(г) - 100", self.download())
+        with self.assertQueryBudget("recipe_update"):
+            response = self.client.put(
+                f"/api/recipes/{self.recipe.id}/",
+                self.payload(self.ingredients[6:18], 5),
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [
+                (ingredient["id"], ingredient["amount"])
+                for ingredient in response.data["ingredients"]
+            ],
+            [(ingredient.id, 5) for ingredient in self.ingredients[6:18]],
+        )
+        lines = self.download()
+        self.assertEqual(len(lines), 12)
+        self.assertIn("ингредиент 17(г) - 5", lines)
+        self.assertNotIn("ингредиент 00(г) - 100", lines)
+
+    def test_partial_update(self):
+        with self.assertQueryBudget("recipe_update_partial"):
+            response = self.client.patch(
+                f"/api/recipes/{self.recipe.id}/",
+                {"name": "Борщ зелёный"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["name"], "Борщ зелёный")
+        self.assertEqual(len(response.data["ingredients"]), 12)
+
+    def test_anonymous_list_follows_changes(self):
+        anonymous = APIClient()
+        response = anonymous.get("/api/recipes/?limit=6")
+        self.assertEqual(response.data["results"][0]["name"], "Борщ")
+        self.client.patch(
+            f"/api/recipes/{self.recipe.id}/",
+            {"name": "Борщ зелёный"},
+            format="json",
+        )
+        response = anonymous.get("/api/recipes/?limit=6")
+        self.assertEqual(response.data["results"][0]["name"], "Борщ зелёный")
+
+    def test_favorites_only_reorder_popular_pages(self):
+        newer = create_recipe(self.alice, "Блины", [], [])
+        anonymous = APIClient()
+        anonymous.get("/api/recipes/?limit=6")
+        response = anonymous.get("/api/recipes/?limit=6&ordering=popular")
+        self.assertEqual(
+            self.recipe_ids(response), [newer.id, self.recipe.id]
+        )
+        self.reader.post(f"/api/recipes/{self.recipe.id}/favorite/")
+        with self.assertNumQueries(0):
+            anonymous.get("/api/recipes/?limit=6")
+        response = anonymous.get("/api/recipes/?limit=6&ordering=popular")
+        self.assertEqual(
+            self.recipe_ids(response), [self.recipe.id, newer.id]
+        )
+
+    def test_unreadable_image_is_not_retried(self):
+        with self.assertLogs("recipes.images", "WARNING"):
+            self.assertFalse(generate_variants(self.recipe.id))
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image_variants_ready)
+        self.assertEqual(self.recipe.image_variant_widths, {})
+        response = self.reader.get(f"/api/recipes/{self.recipe.id}/")
+        self.assertIsNone(response.data["image_variants"])
+        self.assertIsNone(response.data["image_srcset"])
+        output = StringIO()
+        call_command("generate_image_variants", stdout=output)
+        self.assertIn("Rendered: 0, failed: 0", output.getvalue())
+
+    def test_favorite_and_cart(self):
+        url = f"/api/recipes/{self.recipe.id}/"
+        response = self.reader.post(url + "favorite/")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.reader.post(url + "shopping_cart/")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.reader.get(url)
+        self.assertTrue(response.data["is_favorited"])
+        self.assertTrue(response.data["is_in_shopping_cart"])
+        self.assertEqual(len(self.download()), 12)
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.favorites_count, self.recipe.cart_count), (1, 1)
+        )
+        response = self.reader.delete(url + "favorite/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.reader.delete(url + "favorite/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.reader.delete(url + "shopping_cart/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.download(), [])
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.favorites_count, self.recipe.cart_count), (0, 0)
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_feed_survives_fan_out_limit_crossing(self):
+        dave = create_user("dave")
+        subscription = Subscription.objects.create(
+            user=dave, author=self.alice
+        )
+        # Two followers are above the limit, so the recipe is not copied
+        # and the feed reads it from the recipe table.
+        recipe = create_recipe(self.alice, "Блины", [], [])
+        self.assertFalse(TimelineEntry.objects.filter(recipe=recipe).exists())
+        response = self.reader.get("/api/recipes/feed/?limit=6")
+        self.assertEqual(
+            self.recipe_ids(response), [recipe.id, self.recipe.id]
+        )
+        subscription.delete()
+        self.assertEqual(
+            list(
+                TimelineEntry.objects.filter(recipe=recipe).values_list(
+                    "user", flat=True
+                )
+            ),
+            [self.carol.id],
+        )
+        response = self.reader.get("/api/recipes/feed/?limit=6")
+        self.assertEqual(
+            self.recipe_ids(response), [recipe.id, self.recipe.id]
+        )
+
+    def test_counters_never_go_negative(self):
+        Favorite.objects.create(user=self.carol, recipe=self.recipe)
+        Recipe.objects.filter(id=self.recipe.id).update(favorites_count=0)
+        response = self.reader.delete(
+            f"/api/recipes/{self.recipe.id}/favorite/"
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_unsubscribe_clears_feed(self):
+        response = self.reader.get("/api/recipes/feed/?limit=6")
+        self.assertEqual(len(response.data["results"]), 1)
+        response = self.reader.delete(f"/api/users/{self.alice.id}/subscribe/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.reader.get("/api/recipes/feed/?limit=6")
+        self.assertEqual(response.data["results"], [])
+        response = self.reader.post(f"/api/users/{self.alice.id}/subscribe/")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["recipes_count"], 1)
+        response = self.reader.get("/api/recipes/feed/?limit=6")
+        self.assertEqual(len(response.data["results"]), 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeImageTests(APITransactionTestCase):
+    """
+    Image uploads through both request formats, with the variants
+    rendered by the real background executor.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.tags, self.ingredients = create_catalog()
+        self.alice = create_user("alice")
+        self.client.force_authenticate(self.alice)
+
+    def tearDown(self):
+        wait_for_variants()
+
+    def payload(self, content):
+        """JSON request body with the image as a base64 data URI."""
+        return {
+            "ingredients": [
+                {"id": ingredient.id, "amount": 100}
+                for ingredient in self.ingredients[:3]
+            ],
+            "tags": [tag.id for tag in self.tags[:2]],
+            "image": "data:image/png;base64,"
+            + base64.b64encode(content).decode(),
+            "name": "Блины",
+            "text": "Описание рецепта",
+            "cooking_time": 20,
+        }
+
+    def form(self, content):
+        """multipart/form-data body with the image as a file part."""
+        payload = self.payload(content)
+        return {
+            **payload,
+            "ingredients": json.dumps(payload["ingredients"]),
+            "image": SimpleUploadedFile(
+                "photo.png", content, content_type="image/png"
+            ),
+        }
+
+    def post(self, content, request_format):
+        if request_format == "multipart":
+            data = self.form(content)
+        else:
+            data = self.payload(content)
+        return self.client.post("/api/recipes/", data, format=request_format)
+
+    def test_multipart_create_renders_variants(self):
+        response = self.post(make_png(600, 400), "multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["ingredients"]), 3)
+        self.assertEqual(
+            [tag["slug"] for tag in response.data["tags"]],
+            ["breakfast", "lunch"],
+        )
+        wait_for_variants()
+        response = self.client.get(f"/api/recipes/{response.data['id']}/")
+        # 600 pixels fit into the detail size, so it is the largest copy
+        # and keeps the original width.
+        self.assertEqual(
+            sorted(response.data["image_variants"]), ["card", "detail"]
+        )
+        self.assertRegex(
+            response.data["image_srcset"]["webp"],
+            r"^\S+\.card\.webp 480w, \S+\.detail\.webp 600w$",
+        )
+
+    def test_same_image_is_stored_once(self):
+        content = make_png(40, 30)
+        first = self.post(content, "multipart")
+        second = self.post(content, "json")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(first.data["image"], second.data["image"])
+        images = Recipe.objects.order_by().values_list("image", flat=True)
+        self.assertEqual(len(set(images)), 1)
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=1000)
+    def test_too_large_image_is_rejected(self):
+        content = make_png(64, 64, noise=True)
+        self.assertGreater(len(content), 1000)
+        for request_format in ["multipart", "json"]:
+            response = self.post(content, request_format)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+            self.assertIn("Размер изображения", str(response.data["image"]))
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100 * 100)
+    def test_image_with_too_many_pixels_is_rejected(self):
+        response = self.post(make_png(200, 101), "multipart")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("мегапикселей", str(response.data["image"]))
+        response = self.post(make_png(100, 100), "json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_invalid_image_is_rejected(self):
+        payload = self.payload(b"not an image")
+        for image in [payload["image"], "data:image/png;base64,not base64!"]:
+            response = self.client.post(
+                "/api/recipes/", {**payload, "image": image}, format="json"
+            )
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+            self.assertEqual(list(response.data), ["image"])
+
+
+class CatalogRevisionTests(APITestCase):
+    """
+    Catalogs changed by another process, such as manage.py loadmodels
+    next to a local memory cache, do not bump the revisions of this one;
+    the change is picked up once the revisions expire.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def expire_revisions(self):
+        return mock.patch(
+            "time.time",
+            return_value=time.time() + settings.CACHE_REVISION_TIMEOUT + 1,
+        )
+
+    def load_tags(self):
+        # bulk_create sends no signals, like a write from another process.
+        Tag.objects.bulk_create(
+            [Tag(name="Завтрак", color="#E26C2D", slug="breakfast")]
+        )
+
+    def test_tag_filter_sees_loaded_tags(self):
+        url = "/api/recipes/?limit=6&tags=breakfast"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.load_tags()
+        with self.expire_revisions():
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_tag_etag_follows_loaded_tags(self):
+        response = self.client.get("/api/tags/")
+        self.assertEqual(response.data, [])
+        etag = response["ETag"]
+        self.load_tags()
+        with self.expire_revisions():
+            response = self.client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag["slug"] for tag in response.data], ["breakfast"]
+        )
+
+    def test_ingredient_index_sees_loaded_ingredients(self):
+        response = self.client.get("/api/ingredients/?name=абр")
+        self.assertEqual(response.data, [])
+        Ingredient.objects.bulk_create(
+            [Ingredient(name="абрикос", measurement_unit="г")]
+        )
+        with self.expire_revisions():
+            response = self.client.get("/api/ingredients/?name=абр")
+        self.assertEqual(
+            [ingredient["name"] for ingredient in response.data], ["абрикос"]
+        )
@@ -0,0 +1,139 @@
+from django.conf import settings
+from django.db.models import Q
+
+from recipes.models import Recipe, TimelineEntry
+from users.models import Subscription, User
+
+
+def fan_out(recipe):
+    """
+    Adds a new recipe to the timelines of the author's followers.
+    Recipes of authors with more than TIMELINE_FANOUT_LIMIT followers
+    are not copied, get_feed reads them from the recipe table instead.
+    The follower count is checked in the same query that reads the
+    followers, not on a possibly stale author instance.
+    """
+    add_entries(
+        Subscription.objects.filter(
+            author=recipe.author_id,
+            author__followers_count__lte=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list("user", flat=True),
+        recipe.author_id,
+        [(recipe.id, recipe.pub_date)],
+    )
+
+
+def add_entries(user_ids, author_id, recipes):
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for user_id in user_ids
+            for recipe_id, pub_date in recipes
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def latest_recipes(recipes):
+    return recipes.order_by("-pub_date", "-id").values_list("id", "pub_date")[
+        : settings.TIMELINE_BACKFILL_SIZE
+    ]
+
+
+def backfill(user_id, author_id):
+    """Copies the latest recipes of a newly followed author."""
+    add_entries(
+        [user_id],
+        author_id,
+        latest_recipes(
+            Recipe.objects.filter(
+                author=author_id,
+                author__followers_count__lte=settings.TIMELINE_FANOUT_LIMIT,
+            )
+        ),
+    )
+
+
+def remove(user_id, author_id):
+    """
+    Drops the author's recipes from the timeline of a former follower.
+    When the author falls back to TIMELINE_FANOUT_LIMIT followers,
+    get_feed stops reading their recipes on the fly, so the timelines
+    of the remaining followers, who may have followed while the author
+    was above the limit, are backfilled.
+    Relies on followers_count having been decremented already in the
+    same transaction, which serializes concurrent unfollows.
+    """
+    TimelineEntry.objects.filter(user=user_id, author=author_id).delete()
+    followers_count = (
+        User.objects.filter(id=author_id)
+        .values_list("followers_count", flat=True)
+        .first()
+    )
+    if followers_count == settings.TIMELINE_FANOUT_LIMIT:
+        add_entries(
+            Subscription.objects.filter(author=author_id).values_list(
+                "user", flat=True
+            ),
+            author_id,
+            list(latest_recipes(Recipe.objects.filter(author=author_id))),
+        )
+
+
+def rebuild_timelines():
+    """Fills all timelines from scratch."""
+    TimelineEntry.objects.all().delete()
+    subscriptions = Subscription.objects.filter(
+        author__followers_count__lte=settings.TIMELINE_FANOUT_LIMIT
+    )
+    for author_id in (
+        subscriptions.order_by().values_list("author", flat=True).distinct()
+    ):
+        recipes = list(latest_recipes(Recipe.objects.filter(author=author_id)))
+        if recipes:
+            add_entries(
+                subscriptions.filter(author=author_id).values_list(
+                    "user", flat=True
+                ),
+                author_id,
+                recipes,
+            )
+
+
+def get_feed(user, limit, before=None):
+    """
+    (pub_date, recipe_id) of the newest recipes by the authors the user
+    follows, older than before, newest first.
+    Merges the user's timeline with the recipes of followed authors that
+    are too popular to be fanned out.
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    recipes = Recipe.objects.filter(
+        author__in=Subscription.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+        ).values("author")
+    )
+    if before is not None:
+        pub_date, recipe_id = before
+        entries = entries.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, recipe_id__lt=recipe_id)
+        )
+        recipes = recipes.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=recipe_id)
+        )
+    entries = entries.order_by("-pub_date", "-recipe").values_list(
+        "pub_date", "recipe"
+    )
+    recipes = recipes.order_by("-pub_date", "-id").values_list(
+        "pub_date", "id"
+    )
+    rows = set(entries[:limit]) | set(recipes[:limit])
+    return sorted(rows, reverse=True)[:limit]
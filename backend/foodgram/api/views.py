@@ -1,15 +1,33 @@
-import io
+import hashlib
+from collections import defaultdict
 
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.generics import ListAPIView
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from django.db.models import Count, Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Value,
+    Window,
+)
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
 from recipes.models import (
     Favorite,
@@ -21,9 +39,16 @@ from recipes.models import (
 )
 from users.models import Subscription, User
 
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPagination
+from .cache import (
+    get_catalog_revision,
+    get_recipe_list_key,
+    get_shopping_cart,
+)
+from .filters import RecipeFilter
+from .ingredient_index import ingredient_index
+from .pagination import CustomPagination, FeedPagination, RecipePagination
 from .permissions import IsAuthorOrAdminOrReadOnly
+from .renderers import ShoppingCartCSVRenderer, ShoppingCartTextRenderer
 from .serializers import (
     CreateRecipeSerializer,
     FavoriteSerializer,
@@ -36,6 +61,19 @@ from .serializers import (
 )
 
 
+def catalog_etag(catalog):
+    """
+    ETag of a catalog list. It follows the catalog revision, which
+    expires after CACHE_REVISION_TIMEOUT, so clients revalidate against
+    changes made by other processes too.
+    """
+
+    def etag(request, *args, **kwargs):
+        return f"{catalog}-{get_catalog_revision(catalog)}"
+
+    return etag
+
+
 class SubscribeView(APIView):
     """Subscriptions/unsubscriptions."""
 
@@ -49,10 +87,12 @@ class SubscribeView(APIView):
             data=data, context={"request": request}
         )
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    @transaction.atomic
     def delete(self, request, id):
         if Subscription.objects.filter(
             user=request.user.id, author=id
@@ -71,15 +111,62 @@ class ShowSubscriptionsView(ListAPIView):
 
     def get(self, request):
         user = request.user
-        queryset = User.objects.filter(author__user=user).annotate(
-            recipes_count=Count("recipes_model")
+        queryset = (
+            User.objects.filter(author__user=user)
+            .annotate(is_subscribed=Value(True, output_field=BooleanField()))
+            .order_by("-pk")
+            .prefetch_related(
+                Prefetch(
+                    "recipes_model", queryset=Recipe.objects.only("author")
+                )
+            )
         )
         page = self.paginate_queryset(queryset)
+        limit = request.query_params.get("recipes_limit")
         serializer = ShowSubscriptionsSerializer(
-            page, many=True, context={"request": request}
+            page,
+            many=True,
+            context={
+                "request": request,
+                "recipes_preview": self.get_recipes_preview(
+                    page, int(limit) if limit else None
+                ),
+            },
         )
         return self.get_paginated_response(serializer.data)
 
+    def get_recipes_preview(self, authors, limit):
+        """
+        Fetches the latest recipes of every author on the page in one query.
+        With a limit the recipes are numbered per author by a window
+        function and only the first `limit` of each author are selected.
+        """
+        recipes_preview = defaultdict(list)
+        if not authors:
+            # An empty IN () cannot be compiled into the windowed query.
+            return recipes_preview
+        recipes = Recipe.objects.filter(author__in=authors).only(
+            "id", "name", "image", "cooking_time", "author"
+        )
+        if limit is not None:
+            ranked = recipes.annotate(
+                recipe_number=Window(
+                    expression=RowNumber(),
+                    partition_by=[F("author_id")],
+                    order_by=[F("pub_date").desc(), F("id").desc()],
+                )
+            )
+            sql, params = ranked.query.sql_with_params()
+            recipes = Recipe.objects.raw(
+                "SELECT * FROM ({}) AS ranked "
+                "WHERE ranked.recipe_number <= %s "
+                "ORDER BY ranked.recipe_number".format(sql),
+                [*params, limit],
+            )
+        for recipe in recipes:
+            recipes_preview[recipe.author_id].append(recipe)
+        return recipes_preview
+
 
 class FavoriteView(APIView):
     """Adding/removing a recipe from favorites."""
@@ -98,12 +185,14 @@ class FavoriteView(APIView):
                 data=data, context={"request": request}
             )
             if serializer.is_valid():
-                serializer.save()
+                with transaction.atomic():
+                    serializer.save()
                 return Response(
                     serializer.data, status=status.HTTP_201_CREATED
                 )
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    @transaction.atomic
     def delete(self, request, id):
         if Favorite.objects.filter(
             user=request.user.id, recipe=id
@@ -112,6 +201,8 @@ class FavoriteView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@method_decorator(condition(etag_func=catalog_etag("tags")), name="list")
+@method_decorator(condition(etag_func=catalog_etag("tags")), name="retrieve")
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     """Displaying tags."""
 
@@ -123,6 +214,12 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
 
 
+@method_decorator(
+    condition(etag_func=catalog_etag("ingredients")), name="list"
+)
+@method_decorator(
+    condition(etag_func=catalog_etag("ingredients")), name="retrieve"
+)
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     """Displaying ingredients."""
 
@@ -132,12 +229,22 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
-    filter_backends = [
-        IngredientFilter,
-    ]
-    search_fields = [
-        "^name",
-    ]
+
+    def list(self, request, *args, **kwargs):
+        """
+        Ingredients starting with ?name= come first, then those only
+        containing it; ?limit= caps the number of results.
+        """
+        try:
+            limit = int(request.query_params["limit"])
+        except (KeyError, ValueError):
+            limit = None
+        ingredients = ingredient_index.search(
+            request.query_params.get("name", ""),
+            limit if limit and limit > 0 else None,
+        )
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -146,17 +253,117 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = [
         IsAuthorOrAdminOrReadOnly,
     ]
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
+    parser_classes = [JSONParser, MultiPartParser, FormParser]
     queryset = (
         Recipe.objects.all()
         .select_related("author")
-        .prefetch_related("ingredients", "tags")
+        .prefetch_related(
+            Prefetch(
+                "recipe_ingredient_model",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"
+                ),
+            ),
+            "tags",
+        )
     )
     filter_backends = [
         DjangoFilterBackend,
     ]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+        )
+
+    def list(self, request, *args, **kwargs):
+        """
+        Anonymous visitors all see the same pages, so those are cached
+        per query string until a recipe, a tag, an ingredient or a
+        favorite changes. Author names may lag by RECIPE_LIST_CACHE_TIMEOUT.
+        """
+        if not request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+        key = get_recipe_list_key(request)
+        data = cache.get(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            cache.set(key, response.data, settings.RECIPE_LIST_CACHE_TIMEOUT)
+            return response
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = condition(etag_func=self.get_etag)(super().retrieve)(
+            request, *args, **kwargs
+        )
+        patch_vary_headers(response, ["Authorization"])
+        return response
+
+    def get_etag(self, request, pk=None):
+        """
+        Covers everything the recipe detail depends on: the recipe itself,
+        the embedded author fields, the tag and ingredient catalogs and
+        the flags of the current user.
+        """
+        user = request.user
+        if user.is_anonymous:
+            is_subscribed = Value(False, output_field=BooleanField())
+        else:
+            is_subscribed = Exists(
+                Subscription.objects.filter(
+                    user=user, author=OuterRef("author")
+                )
+            )
+        state = (
+            self.get_queryset()
+            .filter(pk=pk)
+            .annotate(is_subscribed=is_subscribed)
+            .values_list(
+                "updated_at",
+                "author__email",
+                "author__username",
+                "author__first_name",
+                "author__last_name",
+                "is_favorited",
+                "is_in_shopping_cart",
+                "is_subscribed",
+            )
+            .first()
+        )
+        if state is None:
+            return None
+        state += (
+            user.id,
+            get_catalog_revision("tags"),
+            get_catalog_revision("ingredients"),
+        )
+        return hashlib.md5(repr(state).encode()).hexdigest()
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        """Recipes by the authors the user follows, newest first."""
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     def get_serializer_class(self):
         if self.request.method == "GET":
             return RecipeSerializer
@@ -185,12 +392,14 @@ class ShoppingCartView(APIView):
                 data=data, context={"request": request}
             )
             if serializer.is_valid():
-                serializer.save()
+                with transaction.atomic():
+                    serializer.save()
                 return Response(
                     serializer.data, status=status.HTTP_201_CREATED
                 )
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    @transaction.atomic
     def delete(self, request, id):
         if ShoppingCart.objects.filter(
             user=request.user, recipe=id
@@ -200,32 +409,24 @@ class ShoppingCartView(APIView):
 
 
 class DownloadShopingCartView(APIView):
+    """
+    Downloading the shopping list.
+    The format is chosen with ?format=txt|csv or the Accept header.
+    """
+
     permission_classes = [IsAuthenticated]
     http_method_names = ["get"]
     pagination_class = None
+    renderer_classes = [ShoppingCartTextRenderer, ShoppingCartCSVRenderer]
 
     def get(self, request):
-        ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__shopping_cart__user=request.user
-            )
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(amount=Sum("amount"))
+        ingredients = sorted(get_shopping_cart(request.user.id).values())
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"'
         )
-        ingredient_list = self.write_to_buffer(ingredients=ingredients)
-        response = HttpResponse(ingredient_list, content_type="StringIO/plain")
         return response
-
-    def write_to_buffer(self, ingredients):
-        ingredient_list = io.StringIO()
-        for ingredient in ingredients:
-            ingredient_list.write(
-                "{name}({measurement_unit}) - {amount}\n".format(
-                    name=ingredient.get("ingredient__name"),
-                    measurement_unit=ingredient.get(
-                        "ingredient__measurement_unit"
-                    ),
-                    amount=ingredient.get("amount"),
-                )
-            )
-        return ingredient_list.getvalue()
@@ -69,6 +69,36 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", default=""),
+    }
+}
+
+CACHE_REVISION_TIMEOUT = 60
+
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 60 * 24
+
+RECIPE_COUNT_CACHE_TIMEOUT = 60
+
+RECIPE_LIST_CACHE_TIMEOUT = 60 * 5
+
+RECIPE_COUNT_ESTIMATE_THRESHOLD = 100000
+
+TIMELINE_FANOUT_LIMIT = 1000
+
+TIMELINE_BACKFILL_SIZE = 100
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", default=2))
+
 AUTH_USER_MODEL = "users.User"
 
 
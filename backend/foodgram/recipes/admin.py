@@ -34,16 +34,13 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ["id", "name", "author", "favorites"]
+    list_display = ["id", "name", "author", "favorites_count"]
     list_display_links = ["name"]
     search_fields = ["name", "author__username"]
     list_filter = ["author", "tags"]
     empty_value_display = EMPTY
     inlines = (IngredientsInLine,)
 
-    def favorites(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
-
     def get_queryset(self, request: HttpRequest) -> QuerySet[Any]:
         return (
             super()
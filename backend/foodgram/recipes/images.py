@@ -0,0 +1,176 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Recipe
+from .signals import variants_ready
+
+logger = logging.getLogger(__name__)
+
+# Longest side of every variant, in pixels, smallest first.
+VARIANTS = {
+    "card": 480,
+    "detail": 960,
+    "retina": 1920,
+}
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_VARIANT_WORKERS,
+    thread_name_prefix="image-variants",
+)
+pending = set()
+
+
+class UnusableImage(Exception):
+    """The stored image is missing or cannot be decoded."""
+
+
+@contextmanager
+def open_image(image_name):
+    """Opens the stored image, raising UnusableImage if it cannot be read."""
+    try:
+        with default_storage.open(image_name) as f:
+            yield Image.open(f)
+    except (OSError, Image.DecompressionBombError) as error:
+        raise UnusableImage(image_name) from error
+
+
+def variant_name(image_name, variant, image_format):
+    """recipes/images/photo.png -> recipes/images/photo.card.webp"""
+    return f"{os.path.splitext(image_name)[0]}.{variant}.{image_format}"
+
+
+def variant_names(image_name):
+    """Returns {variant: {format: file name}} for the image."""
+    return {
+        variant: {
+            image_format: variant_name(image_name, variant, image_format)
+            for image_format in FORMATS
+        }
+        for variant in VARIANTS
+    }
+
+
+def planned_variants(longest):
+    """
+    Variants worth rendering for an image with the given longest side:
+    every size up to the first one that already holds the whole image,
+    since thumbnails are never upscaled.
+    """
+    variants = []
+    for variant, size in VARIANTS.items():
+        variants.append(variant)
+        if size >= longest:
+            break
+    return variants
+
+
+def render_variants(image_name):
+    """
+    Writes the variants of the stored image next to it.
+    Returns {variant: width} of the rendered copies.
+    """
+    with open_image(image_name) as original:
+        original = ImageOps.exif_transpose(original).convert("RGB")
+    widths = {}
+    for variant in planned_variants(max(original.size)):
+        size = VARIANTS[variant]
+        image = original.copy()
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        for image_format, (pil_format, params) in FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, pil_format, **params)
+            name = variant_name(image_name, variant, image_format)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+        widths[variant] = image.width
+    return widths
+
+
+def stored_widths(image_name):
+    """
+    {variant: width} of the variants already rendered for the same
+    image, or None if some of them are missing.
+    Only the image headers are read.
+    """
+    with open_image(image_name) as image:
+        longest = max(image.size)
+    names = variant_names(image_name)
+    widths = {}
+    for variant in planned_variants(longest):
+        if not all(
+            default_storage.exists(name) for name in names[variant].values()
+        ):
+            return None
+        with default_storage.open(names[variant]["webp"]) as f:
+            widths[variant] = Image.open(f).width
+    return widths
+
+
+def generate_variants(recipe_id, force=False):
+    """
+    Renders the variants of the recipe image and marks them as ready.
+    Images are stored by content, so variants left by another recipe
+    with the same image are reused unless force is set.
+    The flag is only set if the recipe still has the same image, so a
+    replacement uploaded meanwhile keeps waiting for its own variants.
+    An image that cannot be read is marked ready without variants, so
+    the sweep does not retry it until the image is replaced.
+    """
+    close_old_connections()
+    try:
+        image_name = (
+            Recipe.objects.filter(id=recipe_id)
+            .values_list("image", flat=True)
+            .first()
+        )
+        if not image_name:
+            return False
+        try:
+            widths = None if force else stored_widths(image_name)
+            if widths is None:
+                widths = render_variants(image_name)
+        except UnusableImage:
+            logger.warning(
+                "Cannot read the image of recipe %s", recipe_id, exc_info=True
+            )
+            widths = {}
+        if Recipe.objects.filter(id=recipe_id, image=image_name).update(
+            image_variants_ready=True,
+            image_variant_widths=widths,
+            updated_at=timezone.now(),
+        ):
+            variants_ready.send(sender=Recipe, recipe_id=recipe_id)
+        return bool(widths)
+    except Exception:
+        logger.exception("Cannot render variants of recipe %s", recipe_id)
+        return False
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(recipe_id):
+    """Renders the variants in a background thread."""
+    future = executor.submit(generate_variants, recipe_id)
+    pending.add(future)
+    future.add_done_callback(pending.discard)
+
+
+def wait_for_variants():
+    """Blocks until every scheduled rendering has finished."""
+    wait(list(pending))
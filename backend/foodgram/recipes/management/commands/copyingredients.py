@@ -0,0 +1,86 @@
+import csv
+import time
+from tempfile import SpooledTemporaryFile
+
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+
+from api.cache import bump_catalog_revision
+from recipes.models import Ingredient
+
+from .loadmodels import Command as LoadModelsCommand
+
+SPOOL_SIZE = 16 * 1024 * 1024
+
+
+class Command(LoadModelsCommand):
+    help = (
+        "Imports ingredients from a JSON or CSV file with COPY on "
+        "PostgreSQL and batched INSERT OR IGNORE on SQLite."
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = []
+        for line in self.read_rows(options["path"]):
+            if "measurement_unit" not in line:
+                raise CommandError("The file does not contain ingredients.")
+            rows.append((line["name"], line["measurement_unit"]))
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                total, inserted = self.copy(table, rows)
+            elif connection.vendor == "sqlite":
+                total, inserted = self.insert_or_ignore(
+                    table, rows, options["batch_size"]
+                )
+            else:
+                raise CommandError(
+                    f"Unsupported database: {connection.vendor}."
+                )
+        if inserted:
+            bump_catalog_revision("ingredients")
+        self.report(inserted, total - inserted, started)
+
+    def copy(self, table, rows):
+        """
+        Streams the rows into a temporary staging table with COPY and
+        moves them into the ingredient table in one statement, leaving
+        duplicates to the unique constraint.
+        """
+        with SpooledTemporaryFile(
+            SPOOL_SIZE, mode="w+", encoding="utf-8", newline=""
+        ) as buffer:
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "CREATE TEMPORARY TABLE ingredient_staging "
+                    "(name varchar(200), measurement_unit varchar(200)) "
+                    "ON COMMIT DROP"
+                )
+                cursor.cursor.copy_expert(
+                    "COPY ingredient_staging FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+                total = cursor.rowcount
+                cursor.execute(
+                    f"INSERT INTO {table} (name, measurement_unit) "
+                    "SELECT DISTINCT name, measurement_unit "
+                    "FROM ingredient_staging "
+                    "ON CONFLICT DO NOTHING"
+                )
+                return total, cursor.rowcount
+
+    def insert_or_ignore(self, table, rows, batch_size):
+        inserted = 0
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                stop = start + batch_size
+                cursor.executemany(
+                    f"INSERT OR IGNORE INTO {table} "
+                    "(name, measurement_unit) VALUES (%s, %s)",
+                    rows[start:stop],
+                )
+                inserted += cursor.rowcount
+        return len(rows), inserted
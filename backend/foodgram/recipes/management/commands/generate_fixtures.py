@@ -0,0 +1,255 @@
+import os
+import random
+import time
+from io import StringIO
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag, ShoppingCart,
+    Tag,
+)
+from users.models import Subscription, User
+
+DATA_DIR = os.path.join(settings.BASE_DIR, "recipes", "data")
+EMAIL = "fixture{seed}.{number}@foodgram.test"
+IMAGE = "recipes/images/fixture.png"
+AMOUNTS = {
+    "г": (10, 500),
+    "мл": (10, 1000),
+    "кг": (1, 3),
+    "л": (1, 3),
+    "шт.": (1, 10),
+}
+
+
+def zipf_weights(population, generator, exponent=1.0):
+    """
+    Cumulative weights giving the population items, in a random order,
+    a Zipf-like popularity: the n-th item is picked 1/n^exponent as often
+    as the first one.
+    """
+    ranks = list(range(1, len(population) + 1))
+    generator.shuffle(ranks)
+    return list(accumulate(1 / rank**exponent for rank in ranks))
+
+
+def weighted_sample(population, cum_weights, count, generator):
+    """Picks count distinct items with the given cumulative weights."""
+    count = min(count, len(population))
+    chosen = set()
+    while len(chosen) < count:
+        chosen.update(
+            generator.choices(
+                population, cum_weights=cum_weights, k=count - len(chosen)
+            )
+        )
+    return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with synthetic users, recipes, subscriptions, "
+        "favorites and shopping carts for profiling."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--password",
+            type=str,
+            default=None,
+            help="password of the generated users (unusable by default)",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        self.random = random.Random(options["seed"])
+        self.seed = options["seed"]
+        self.batch_size = options["batch_size"]
+        if User.objects.filter(email=self.email(0)).exists():
+            raise CommandError(
+                f"Fixtures with seed {self.seed} are already loaded."
+            )
+        for filename in ("tags.json", "ingredients.json"):
+            call_command(
+                "loadmodels",
+                path=os.path.join(DATA_DIR, filename),
+                stdout=StringIO(),
+            )
+        with transaction.atomic():
+            user_ids = self.create_users(
+                options["users"], make_password(options["password"])
+            )
+            popularity = zipf_weights(user_ids, self.random)
+            recipe_ids = self.create_recipes(
+                options["recipes"], user_ids, popularity
+            )
+            counts = self.create_relations(user_ids, popularity, recipe_ids)
+        call_command("recount", stdout=StringIO())
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.stdout.write(
+            "Created {users} users, {recipes} recipes, {subscriptions} "
+            "subscriptions, {favorites} favorites and {carts} cart items "
+            "in {elapsed:.1f}s".format(
+                users=len(user_ids),
+                recipes=len(recipe_ids),
+                elapsed=time.perf_counter() - started,
+                **counts,
+            )
+        )
+
+    def email(self, number):
+        return EMAIL.format(seed=self.seed, number=number)
+
+    def create_users(self, count, password):
+        User.objects.bulk_create(
+            (
+                User(
+                    email=self.email(number),
+                    username=f"fixture{self.seed}_{number}",
+                    first_name="Имя",
+                    last_name="Фамилия",
+                    password=password,
+                )
+                for number in range(count)
+            ),
+            batch_size=self.batch_size,
+        )
+        return list(
+            User.objects.filter(
+                email__startswith=f"fixture{self.seed}.",
+                email__endswith="@foodgram.test",
+            )
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def create_recipes(self, count, user_ids, popularity):
+        """
+        Popular authors write more recipes; ingredients and tags are
+        drawn with a long tail, so a few of them occur in most recipes.
+        """
+        units = dict(Ingredient.objects.values_list("id", "measurement_unit"))
+        ingredient_ids = list(units)
+        ingredient_weights = zipf_weights(ingredient_ids, self.random)
+        tag_ids = list(Tag.objects.values_list("id", flat=True))
+        tag_weights = zipf_weights(tag_ids, self.random, exponent=0.5)
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=author_id,
+                    name=f"Рецепт {number}",
+                    text="Описание рецепта",
+                    cooking_time=min(
+                        int(self.random.lognormvariate(3.4, 0.7)) + 1, 600
+                    ),
+                    image=IMAGE,
+                )
+                for number, author_id in enumerate(
+                    self.random.choices(
+                        user_ids, cum_weights=popularity, k=count
+                    )
+                )
+            ),
+            batch_size=self.batch_size,
+        )
+        recipe_ids = list(
+            Recipe.objects.filter(author__in=user_ids)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(
+                        *AMOUNTS.get(units[ingredient_id], (1, 5))
+                    ),
+                )
+                for recipe_id in recipe_ids
+                for ingredient_id in weighted_sample(
+                    ingredient_ids,
+                    ingredient_weights,
+                    self.random.randint(10, 20),
+                    self.random,
+                )
+            ),
+            batch_size=self.batch_size,
+        )
+        RecipeTag.objects.bulk_create(
+            (
+                RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in weighted_sample(
+                    tag_ids,
+                    tag_weights,
+                    self.random.randint(1, 3),
+                    self.random,
+                )
+            ),
+            batch_size=self.batch_size,
+        )
+        return recipe_ids
+
+    def long_tail(self, limit):
+        """Pareto-distributed count: most users do little, a few a lot."""
+        return min(int(self.random.paretovariate(1.2)) - 1, limit)
+
+    def create_relations(self, user_ids, popularity, recipe_ids):
+        """
+        Each user follows and favorites a long-tailed number of authors
+        and recipes, preferring popular ones, so followers per author
+        follow a power law.
+        """
+        recipe_weights = zipf_weights(recipe_ids, self.random)
+        subscriptions, favorites, carts = [], [], []
+        for user_id in user_ids:
+            subscriptions.extend(
+                Subscription(user_id=user_id, author_id=author_id)
+                for author_id in weighted_sample(
+                    user_ids,
+                    popularity,
+                    self.long_tail(len(user_ids) // 2),
+                    self.random,
+                )
+                if author_id != user_id
+            )
+            favorites.extend(
+                Favorite(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in weighted_sample(
+                    recipe_ids,
+                    recipe_weights,
+                    self.long_tail(len(recipe_ids) // 2),
+                    self.random,
+                )
+            )
+            carts.extend(
+                ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in weighted_sample(
+                    recipe_ids,
+                    recipe_weights,
+                    self.random.randint(0, 5),
+                    self.random,
+                )
+            )
+        for model, objects in (
+            (Subscription, subscriptions),
+            (Favorite, favorites),
+            (ShoppingCart, carts),
+        ):
+            model.objects.bulk_create(objects, batch_size=self.batch_size)
+        return {
+            "subscriptions": len(subscriptions),
+            "favorites": len(favorites),
+            "carts": len(carts),
+        }
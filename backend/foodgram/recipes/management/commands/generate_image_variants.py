@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders resized copies of recipe images that do not have them. "
+        "With --interval it keeps sweeping, picking up renderings lost "
+        "when a web worker stopped before finishing them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true", help="render every image again"
+        )
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--interval",
+            type=int,
+            help="sweep again every INTERVAL seconds instead of exiting",
+        )
+
+    def handle(self, *args, **options):
+        if not options["interval"]:
+            self.sweep(options["workers"], force=options["all"])
+            return
+        interval = timedelta(seconds=options["interval"])
+        while True:
+            # Recipes changed within the last interval are most likely
+            # still queued in the web worker that saved them.
+            self.sweep(
+                options["workers"], updated_before=timezone.now() - interval
+            )
+            time.sleep(interval.total_seconds())
+
+    def sweep(self, workers, force=False, updated_before=None):
+        started = time.perf_counter()
+        recipes = Recipe.objects.exclude(image="")
+        if not force:
+            recipes = recipes.filter(image_variants_ready=False)
+        if updated_before is not None:
+            recipes = recipes.filter(updated_at__lt=updated_before)
+        recipe_ids = list(recipes.values_list("id", flat=True))
+        if not recipe_ids and updated_before is not None:
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rendered = sum(
+                executor.map(
+                    partial(generate_variants, force=force), recipe_ids
+                )
+            )
+        self.stdout.write(
+            "Rendered: {rendered}, failed: {failed}, "
+            "elapsed: {elapsed:.2f}s".format(
+                rendered=rendered,
+                failed=len(recipe_ids) - rendered,
+                elapsed=time.perf_counter() - started,
+            )
+        )
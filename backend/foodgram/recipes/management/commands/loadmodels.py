@@ -1,34 +1,95 @@
+import csv
 import json
+import os
+import time
+from itertools import chain
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import bump_catalog_revision
 from recipes.models import Ingredient, Tag
 
+CSV_FIELDS = {
+    2: ["name", "measurement_unit"],
+    3: ["name", "color", "slug"],
+}
+
 
 class Command(BaseCommand):
+    help = "Loads tags or ingredients from a JSON or CSV file."
+
     def add_arguments(self, parser):
         parser.add_argument("--path", type=str, help="file path")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="rows per INSERT"
+        )
 
     def handle(self, *args, **options):
-        file_path = options["path"]
-
-        with open(file_path, encoding="utf-8") as f:
-            jsondata = json.load(f)
-            if "color" in jsondata[0]:
-                for line in jsondata:
-                    if not Tag.objects.filter(slug=line["slug"]).exists():
-                        Tag.objects.create(
-                            name=line["name"],
-                            color=line["color"],
-                            slug=line["slug"],
-                        )
-            elif "measurement_unit" in jsondata[0]:
-                for line in jsondata:
-                    if not Ingredient.objects.filter(
-                        name=line["name"],
-                        measurement_unit=line["measurement_unit"],
-                    ).exists():
-                        Ingredient.objects.create(
-                            name=line["name"],
-                            measurement_unit=line["measurement_unit"],
-                        )
+        started = time.perf_counter()
+        rows = self.read_rows(options["path"])
+        first = next(rows, None)
+        if first is None:
+            raise CommandError("The file is empty.")
+        if "color" in first:
+            model, catalog = Tag, "tags"
+            existing = set(Tag.objects.values_list("slug", flat=True))
+
+            def key(line):
+                return line["slug"]
+
+        elif "measurement_unit" in first:
+            model, catalog = Ingredient, "ingredients"
+            existing = set(
+                Ingredient.objects.values_list("name", "measurement_unit")
+            )
+
+            def key(line):
+                return line["name"], line["measurement_unit"]
+
+        else:
+            raise CommandError("Unknown file format.")
+
+        objects, total = [], 0
+        for line in chain([first], rows):
+            total += 1
+            if key(line) in existing:
+                continue
+            existing.add(key(line))
+            objects.append(model(**line))
+        with transaction.atomic():
+            # Rows inserted concurrently are dropped by ignore_conflicts,
+            # so the inserted count comes from the table itself.
+            before = model.objects.count()
+            model.objects.bulk_create(
+                objects,
+                batch_size=options["batch_size"],
+                ignore_conflicts=True,
+            )
+            inserted = model.objects.count() - before
+        if inserted:
+            bump_catalog_revision(catalog)
+        self.report(inserted, total - inserted, started)
+
+    def report(self, inserted, skipped, started):
+        self.stdout.write(
+            "Inserted: {inserted}, skipped: {skipped}, "
+            "elapsed: {elapsed:.2f}s".format(
+                inserted=inserted,
+                skipped=skipped,
+                elapsed=time.perf_counter() - started,
+            )
+        )
+
+    def read_rows(self, file_path):
+        """Yields the file rows as dicts; CSV files have no header row."""
+        extension = os.path.splitext(file_path)[1].lower()
+        with open(file_path, encoding="utf-8", newline="") as f:
+            if extension == ".csv":
+                for line in csv.reader(f):
+                    fields = CSV_FIELDS.get(len(line))
+                    if fields is None:
+                        raise CommandError(f"Unexpected CSV row: {line}")
+                    yield dict(zip(fields, line))
+            else:
+                yield from json.load(f)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.timeline import rebuild_timelines
+from recipes.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the subscription feeds of all users from scratch."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_timelines()
+        self.stdout.write(
+            "Timeline entries: {}".format(TimelineEntry.objects.count())
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+
+def count_related(model, field):
+    """Number of `model` rows pointing at the outer row through `field`."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = "Recomputes the denormalized counters from the source tables."
+
+    def handle(self, *args, **options):
+        favorites_count = count_related(Favorite, "recipe")
+        cart_count = count_related(ShoppingCart, "recipe")
+        updated = Recipe.objects.exclude(
+            favorites_count=favorites_count, cart_count=cart_count
+        ).update(favorites_count=favorites_count, cart_count=cart_count)
+        self.stdout.write(f"Recipes fixed: {updated}")
+        recipes_count = count_related(Recipe, "author")
+        followers_count = count_related(Subscription, "author")
+        updated = User.objects.exclude(
+            recipes_count=recipes_count, followers_count=followers_count
+        ).update(recipes_count=recipes_count, followers_count=followers_count)
+        self.stdout.write(f"Users fixed: {updated}")
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.13 on 2026-10-18 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0008_auto_20220712_1431"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, verbose_name="Время изменения"
+            ),
+        ),
+    ]
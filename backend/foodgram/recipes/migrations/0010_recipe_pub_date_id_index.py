@@ -0,0 +1,26 @@
+# Generated by Django 3.2.13 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0009_recipe_updated_at"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="recipe",
+            options={
+                "ordering": ("-pub_date", "-id"),
+                "verbose_name": "Рецепт",
+                "verbose_name_plural": "Рецепты",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"
+            ),
+        ),
+    ]
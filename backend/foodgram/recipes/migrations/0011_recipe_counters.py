@@ -0,0 +1,61 @@
+# Generated by Django 3.2.13 on 2026-10-18 01:28
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    Favorite = apps.get_model("recipes", "Favorite")
+    ShoppingCart = apps.get_model("recipes", "ShoppingCart")
+    Recipe.objects.update(
+        favorites_count=count_related(Favorite, "recipe"),
+        cart_count=count_related(ShoppingCart, "recipe"),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0010_recipe_pub_date_id_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="cart_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Добавлений в корзину"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                verbose_name="Добавлений в избранное",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-favorites_count", "-pub_date", "-id"],
+                name="recipe_popular_idx",
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
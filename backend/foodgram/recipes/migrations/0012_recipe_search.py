@@ -0,0 +1,110 @@
+# Full-text search over recipe name and text. The search structures are
+# database-specific and are not part of the model state: PostgreSQL gets
+# a tsvector column maintained by a trigger with a GIN index, SQLite an
+# external-content FTS5 table synced by triggers. See api/search.py.
+
+from django.db import migrations
+
+POSTGRESQL_FORWARD = [
+    "ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION recipes_recipe_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(
+                to_tsvector('pg_catalog.russian', coalesce(NEW.name, '')), 'A'
+            ) ||
+            setweight(
+                to_tsvector('pg_catalog.russian', coalesce(NEW.text, '')), 'B'
+            );
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update()
+    """,
+    "UPDATE recipes_recipe SET name = name",
+    "CREATE INDEX recipe_search_vector_idx ON recipes_recipe "
+    "USING gin (search_vector)",
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP TRIGGER recipes_recipe_search_vector_update ON recipes_recipe",
+    "DROP FUNCTION recipes_recipe_search_vector_update()",
+    "ALTER TABLE recipes_recipe DROP COLUMN search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_insert AFTER INSERT ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_delete AFTER DELETE ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_fts (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    "INSERT INTO recipes_recipe_fts (recipes_recipe_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER recipes_recipe_fts_update",
+    "DROP TRIGGER recipes_recipe_fts_delete",
+    "DROP TRIGGER recipes_recipe_fts_insert",
+    "DROP TABLE recipes_recipe_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0011_recipe_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run(
+                {
+                    "postgresql": POSTGRESQL_FORWARD,
+                    "sqlite": SQLITE_FORWARD,
+                }
+            ),
+            run(
+                {
+                    "postgresql": POSTGRESQL_BACKWARD,
+                    "sqlite": SQLITE_BACKWARD,
+                }
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.13 on 2026-10-18 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0012_recipe_search"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipeingredient",
+            index=models.Index(
+                fields=["ingredient", "recipe"], name="ingredient_recipe_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.13 on 2026-10-18 01:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0013_recipe_ingredient_lookup_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="image_variants_ready",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                verbose_name="Уменьшенные копии изображения готовы",
+            ),
+        ),
+    ]
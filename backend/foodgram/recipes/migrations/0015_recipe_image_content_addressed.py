@@ -0,0 +1,23 @@
+# Generated by Django 3.2.13 on 2026-10-18 01:40
+
+from django.db import migrations, models
+
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0014_recipe_image_variants_ready"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recipe",
+            name="image",
+            field=models.ImageField(
+                storage=recipes.storage.ContentAddressedStorage(),
+                upload_to="recipes/images/",
+                verbose_name="Изображение",
+            ),
+        ),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 3.2.13 on 2026-10-18 01:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Values of TIMELINE_FANOUT_LIMIT and TIMELINE_BACKFILL_SIZE at the time.
+FANOUT_LIMIT = 1000
+BACKFILL_SIZE = 100
+
+
+def fill_timelines(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    TimelineEntry = apps.get_model("recipes", "TimelineEntry")
+    Subscription = apps.get_model("users", "Subscription")
+    subscriptions = Subscription.objects.filter(
+        author__followers_count__lte=FANOUT_LIMIT
+    )
+    for author_id in (
+        subscriptions.order_by().values_list("author", flat=True).distinct()
+    ):
+        recipes = list(
+            Recipe.objects.filter(author=author_id)
+            .order_by("-pub_date", "-id")
+            .values_list("id", "pub_date")[:BACKFILL_SIZE]
+        )
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for user_id in subscriptions.filter(
+                    author=author_id
+                ).values_list("user", flat=True)
+                for recipe_id, pub_date in recipes
+            ),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recipes", "0015_recipe_image_content_addressed"),
+        ("users", "0003_user_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "pub_date",
+                    models.DateTimeField(verbose_name="Время публикации"),
+                ),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Автор рецепта",
+                    ),
+                ),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to="recipes.recipe",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Подписчик",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Запись ленты",
+                "verbose_name_plural": "Лента подписок",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="timelineentry",
+            index=models.Index(
+                fields=["user", "-pub_date", "-recipe"],
+                name="timeline_user_pub_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="timelineentry",
+            index=models.Index(
+                fields=["user", "author"], name="timeline_user_author_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="timelineentry",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"), name="user_timeline_unique"
+            ),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.13 on 2026-10-18 02:02
+
+from django.db import migrations, models
+
+
+def reset_variants(apps, schema_editor):
+    """
+    Variants rendered so far have no recorded widths; the sweep in
+    generate_image_variants picks them up again and reuses the files.
+    """
+    Recipe = apps.get_model("recipes", "Recipe")
+    Recipe.objects.filter(image_variants_ready=True).update(
+        image_variants_ready=False
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0016_timeline"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="image_variant_widths",
+            field=models.JSONField(
+                default=dict,
+                editable=False,
+                verbose_name="Ширина уменьшенных копий",
+            ),
+        ),
+        migrations.RunPython(reset_variants, migrations.RunPython.noop),
+    ]
@@ -3,6 +3,8 @@ from django.core.validators import MinValueValidator
 from django.db import models
 from django.db.models import UniqueConstraint
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -58,7 +60,11 @@ class Recipe(models.Model):
         verbose_name="Ингредиенты",
         related_name="ingredient",
     )
-    image = models.ImageField("Изображение", upload_to="recipes/images/")
+    image = models.ImageField(
+        "Изображение",
+        upload_to="recipes/images/",
+        storage=ContentAddressedStorage(),
+    )
     name = models.CharField("Название рецепта", max_length=200)
     text = models.TextField(
         "Описание рецепта", help_text="Введите описание рецепта"
@@ -75,11 +81,36 @@ class Recipe(models.Model):
         "Время публикации",
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        "Время изменения",
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        "Добавлений в избранное", default=0, editable=False
+    )
+    cart_count = models.PositiveIntegerField(
+        "Добавлений в корзину", default=0, editable=False
+    )
+    image_variants_ready = models.BooleanField(
+        "Уменьшенные копии изображения готовы", default=False, editable=False
+    )
+    image_variant_widths = models.JSONField(
+        "Ширина уменьшенных копий", default=dict, editable=False
+    )
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
-        ordering = ("-pub_date",)
+        ordering = ("-pub_date", "-id")
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"
+            ),
+            models.Index(
+                fields=["-favorites_count", "-pub_date", "-id"],
+                name="recipe_popular_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -111,6 +142,12 @@ class RecipeIngredient(models.Model):
                 name="recipe_ingredient_unique",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["ingredient", "recipe"],
+                name="ingredient_recipe_idx",
+            ),
+        ]
 
 
 class RecipeTag(models.Model):
@@ -180,3 +217,45 @@ class Favorite(models.Model):
                 fields=["user", "recipe"], name="user_favorite_unique"
             )
         ]
+
+
+class TimelineEntry(models.Model):
+    """A recipe in the subscription feed of a follower of its author."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Подписчик",
+        related_name="timeline",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name="Рецепт",
+        related_name="timeline_entries",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Автор рецепта",
+        related_name="+",
+    )
+    pub_date = models.DateTimeField("Время публикации")
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Лента подписок"
+        constraints = [
+            UniqueConstraint(
+                fields=["user", "recipe"], name="user_timeline_unique"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"],
+                name="timeline_user_pub_date_idx",
+            ),
+            models.Index(
+                fields=["user", "author"], name="timeline_user_author_idx"
+            ),
+        ]
@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import Favorite, Recipe, ShoppingCart
+
+User = get_user_model()
+
+# Sent by recipes.images when the image variants of a recipe are ready,
+# since the flag is set with a queryset update that sends no post_save.
+variants_ready = Signal()
+
+
+def change_counter(queryset, field, delta):
+    """
+    Adds delta to the counter column. Counters never go below zero, so a
+    counter that drifted (e.g. rows inserted in bulk) cannot fail the
+    CHECK constraint of PositiveIntegerField.
+    """
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(id=instance.recipe_id), "favorites_count", 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(id=instance.recipe_id), "favorites_count", -1
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(id=instance.recipe_id), "cart_count", 1
+        )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_removed(instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(id=instance.recipe_id), "cart_count", -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_added(instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(id=instance.author_id), "recipes_count", 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(instance, **kwargs):
+    change_counter(
+        User.objects.filter(id=instance.author_id), "recipes_count", -1
+    )
@@ -0,0 +1,35 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores files under the SHA-256 of their content,
+    recipes/images/photo.png -> recipes/images/3f/3f2a....png.
+    Uploading the same bytes again reuses the stored file, and a file
+    behind a URL never changes, so it can be cached forever.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        name = os.path.join(
+            os.path.dirname(name),
+            digest[:2],
+            digest + os.path.splitext(name)[1].lower(),
+        )
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
@@ -0,0 +1,68 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from recipes.models import Ingredient, Tag
+
+
+class LoadCommandTests(TestCase):
+    """Counts reported by loadmodels and copyingredients."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        Ingredient.objects.create(name="абрикос", measurement_unit="г")
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def call(self, command, path):
+        output = StringIO()
+        call_command(command, path=path, batch_size=2, stdout=output)
+        return output.getvalue()
+
+    def ingredients_csv(self):
+        # One row already exists and one is repeated in the file.
+        return self.write(
+            "ingredients.csv",
+            "абрикос,г\nбанан,шт\nвишня,г\nбанан,шт\nгруша,шт\n",
+        )
+
+    def test_loadmodels_counts_inserted_ingredients(self):
+        output = self.call("loadmodels", self.ingredients_csv())
+        self.assertIn("Inserted: 3, skipped: 2", output)
+        self.assertEqual(Ingredient.objects.count(), 4)
+        output = self.call("loadmodels", self.ingredients_csv())
+        self.assertIn("Inserted: 0, skipped: 5", output)
+
+    def test_copyingredients_counts_inserted_ingredients(self):
+        output = self.call("copyingredients", self.ingredients_csv())
+        self.assertIn("Inserted: 3, skipped: 2", output)
+        self.assertEqual(Ingredient.objects.count(), 4)
+
+    def test_loadmodels_loads_tags_from_json(self):
+        tags = [
+            {"name": "Завтрак", "color": "#E26C2D", "slug": "breakfast"},
+            {"name": "Обед", "color": "#49B64E", "slug": "lunch"},
+        ]
+        path = self.write("tags.json", json.dumps(tags))
+        output = self.call("loadmodels", path)
+        self.assertIn("Inserted: 2, skipped: 0", output)
+        self.assertEqual(
+            list(Tag.objects.values_list("slug", flat=True)),
+            ["breakfast", "lunch"],
+        )
+
+    def test_copyingredients_rejects_tags(self):
+        path = self.write("tags.csv", "Завтрак,#E26C2D,breakfast\n")
+        with self.assertRaises(CommandError):
+            self.call("copyingredients", path)
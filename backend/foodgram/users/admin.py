@@ -10,7 +10,14 @@ from .models import Subscription, User
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ["username", "email", "first_name", "last_name"]
+    list_display = [
+        "username",
+        "email",
+        "first_name",
+        "last_name",
+        "recipes_count",
+        "followers_count",
+    ]
     list_display_links = ["username"]
     search_fields = ["username", "email"]
     ordering = ["username"]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.13 on 2026-10-18 01:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    Recipe = apps.get_model("recipes", "Recipe")
+    Subscription = apps.get_model("users", "Subscription")
+    User.objects.update(
+        recipes_count=count_related(Recipe, "author"),
+        followers_count=count_related(Subscription, "author"),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0011_recipe_counters"),
+        ("users", "0002_auto_20220628_1708"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="followers_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                verbose_name="Количество подписчиков",
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="recipes_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Количество рецептов"
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -14,6 +14,12 @@ class User(AbstractUser):
     username = models.CharField(
         "Юзернейм", max_length=150, validators=[validate_username]
     )
+    recipes_count = models.PositiveIntegerField(
+        "Количество рецептов", default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        "Количество подписчиков", default=0, editable=False
+    )
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
 
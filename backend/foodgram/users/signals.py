@@ -0,0 +1,21 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Subscription, User
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_added(instance, created, **kwargs):
+    if created:
+        User.objects.filter(id=instance.author_id).update(
+            followers_count=F("followers_count") + 1
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_removed(instance, **kwargs):
+    User.objects.filter(id=instance.author_id).update(
+        followers_count=Greatest(F("followers_count") - 1, 0)
+    )